@@ -1,21 +1,29 @@
 import os
+import anyio
 import openai
-import requests
+from functools import partial
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, List, Optional
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
+from backend.app.core.http_client import http_client, get_llm_session
+from backend.app.core.api_keys import load_keys
+from backend.app.services.embedding_cache import embedding_cache
 
 load_dotenv()
 
 # === Environment Setup ===
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# First key of the OPENAI_API_KEYS / GROQ_API_KEYS pool, else the single-key variable
+OPENAI_API_KEY = (load_keys("OPENAI_API_KEYS", os.getenv("OPENAI_API_KEY")) or [None])[0]
+GROQ_API_KEY = (load_keys("GROQ_API_KEYS", os.getenv("GROQ_API_KEY")) or [None])[0]
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "citation-theme-bot")
+EMB_DIM = int(os.getenv("PINECONE_DIMENSION", 768))  # all-mpnet-base-v2, as used by upload.py
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
 
+_DEFAULT_MODELS = {"openai": "gpt-4-turbo", "groq": "llama3-8b-8192"}
+
 if not PINECONE_API_KEY:
     raise RuntimeError("Missing PINECONE_API_KEY")
 if LLM_PROVIDER == "openai" and not OPENAI_API_KEY:
@@ -34,7 +42,7 @@ existing_indexes = pc.list_indexes().names()
 if PINECONE_INDEX_NAME not in existing_indexes:
     pc.create_index(
         name=PINECONE_INDEX_NAME,
-        dimension=2048,  # use your embedding size
+        dimension=EMB_DIM,
         metric='cosine',  # or 'euclidean' based on your use case
         spec=ServerlessSpec(
             cloud='aws',       # adjust cloud and region as needed
@@ -59,19 +67,26 @@ class QueryResponse(BaseModel):
     answer: str
     citations: Dict[str, List[str]]
 
-# === Embedding Function ===
-def embed_text(text: str) -> List[float]:
+# === Embedding Functions ===
+def embed_texts(texts: List[str]) -> List[List[float]]:
     try:
         res = openai.Embedding.create(
-            input=text[:1024],
+            input=[t[:1024] for t in texts],
             model="text-embedding-ada-002"
         )
-        return res['data'][0]['embedding']
+        return [d['embedding'] for d in res['data']]
     except Exception as e:
         raise RuntimeError(f"Embedding failed: {e}")
 
+def embed_text(text: str) -> List[float]:
+    return embedding_cache.get_or_compute(
+        text,
+        lambda t: embed_texts([t])[0],
+        model="text-embedding-ada-002"
+    )
+
 # === LLM Call Wrappers ===
-def call_groq_llm(prompt: str, model: str = "llama3-8b-8192") -> str:
+async def call_groq_llm(prompt: str, model: str = "llama3-8b-8192") -> str:
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
@@ -83,15 +98,17 @@ def call_groq_llm(prompt: str, model: str = "llama3-8b-8192") -> str:
         "max_tokens": 800
     }
     try:
-        res = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
+        res = await http_client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
         res.raise_for_status()
         return res.json()["choices"][0]["message"]["content"].strip()
     except Exception as e:
         raise RuntimeError(f"Groq LLM failed: {e}")
 
-def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
+async def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
+    # Route acreate through the shared pooled aiohttp session
+    openai.aiosession.set(get_llm_session())
     try:
-        res = openai.ChatCompletion.create(
+        res = await openai.ChatCompletion.acreate(
             model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
@@ -101,16 +118,15 @@ def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
     except Exception as e:
         raise RuntimeError(f"OpenAI LLM failed: {e}")
 
-def call_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None) -> str:
+async def call_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None) -> str:
     provider = provider or LLM_PROVIDER
-    model = model or {"openai": "gpt-4-turbo", "groq": "llama3-8b-8192"}.get(provider)
+    if provider not in _DEFAULT_MODELS:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+    model = model or _DEFAULT_MODELS[provider]
 
     if provider == "openai":
-        return call_openai_llm(prompt, model)
-    elif provider == "groq":
-        raise RuntimeError("Groq LLM provider currently disabled due to 404 error.")
-    else:
-        raise ValueError(f"Unsupported LLM provider: {provider}")
+        return await call_openai_llm(prompt, model)
+    raise RuntimeError("Groq LLM provider currently disabled due to 404 error.")
 
 
 # === Query Endpoint ===
@@ -118,12 +134,13 @@ def call_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] =
 async def query_docs(request: QueryRequest):
     try:
         # 1. Query Pinecone using integrated embedding
-        results = index.query(
+        results = await anyio.to_thread.run_sync(partial(
+            index.query,
             top_k=request.top_k,
             include_metadata=True,
             text=request.q.strip()[:1024],
             embed=True
-        )
+        ))
         print(results)
 
         # 2. Handle no matches & casual greetings
@@ -134,7 +151,7 @@ async def query_docs(request: QueryRequest):
                     citations={}
                 )
             try:
-                answer = call_llm(
+                answer = await call_llm(
                     f"The user asked: '{request.q}'. Respond helpfully, even without documents."
                 )
                 return QueryResponse(answer=answer, citations={})
@@ -158,13 +175,14 @@ async def query_docs(request: QueryRequest):
                     citations_map[doc_id].append(ref)
 
         # 4. Build prompt
-        prompt = "You are an AI research assistant helping with document analysis. Use the following excerpts:\n\n"
+        parts = ["You are an AI research assistant helping with document analysis. Use the following excerpts:\n\n"]
         for i, chunk in enumerate(chunks):
-            prompt += f"Excerpt {i + 1}:\n{chunk}\n\n"
-        prompt += f"Question: {request.q}\n\nAnswer based only on the excerpts."
+            parts.append(f"Excerpt {i + 1}:\n{chunk}\n\n")
+        parts.append(f"Question: {request.q}\n\nAnswer based only on the excerpts.")
+        prompt = "".join(parts)
 
         # 5. Call LLM for answer
-        answer = call_llm(prompt, model=request.model)
+        answer = await call_llm(prompt, model=request.model)
 
         return QueryResponse(answer=answer, citations=citations_map)
 
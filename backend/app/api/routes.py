@@ -1,31 +1,60 @@
-from fastapi import APIRouter, File, UploadFile, Form
+from fastapi import APIRouter, BackgroundTasks, File, UploadFile, Form
 from fastapi.responses import JSONResponse
 from typing import List
 from pathlib import Path
 from uuid import uuid4
+from itertools import repeat
 import os
+import shutil
+import anyio
+import diskcache
 
 from backend.app.services.ocr import ocr_pdf
 from backend.app.services.embedding import embed_and_store_chunks
-from backend.app.services.theme_identifier import identify_themes
+from backend.app.services.theme_worker_pool import theme_worker_pool
 
 # Router init
 router = APIRouter()
 
+# Theme job store on disk, shared by worker processes; entries expire after JOB_TTL seconds
+JOB_TTL = int(os.getenv("JOB_TTL", 3600))
+JOBS = diskcache.Cache(os.getenv("JOBS_DIR", ".jobs"))
+
+
+def _iter_chunks(s: str, n: int = 800):
+    """Lazily yield fixed-size slices of s."""
+    for i in range(0, len(s), n):
+        yield s[i:i + n]
+
+
+def _save_upload(file: UploadFile, path: Path):
+    """Stream an uploaded file to disk in 1MB chunks."""
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+
+
+async def _run_themes(job_id: str, text: str, doc_id: str):
+    """Identify themes for an analyzed document and record the result."""
+    try:
+        themes = await theme_worker_pool.submit(_iter_chunks(text), repeat(doc_id))
+        JOBS.set(job_id, {"status": "done", "themes": themes}, expire=JOB_TTL)
+    except Exception as e:
+        JOBS.set(job_id, {"status": "failed", "error": str(e)}, expire=JOB_TTL)
+
+
 # Upload and analyze single document
 @router.post("/analyze")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(background: BackgroundTasks, file: UploadFile = File(...)):
     try:
         # Step 1: Save uploaded file
         upload_dir = Path("data/uploads")
         upload_dir.mkdir(parents=True, exist_ok=True)
         ext = Path(file.filename).suffix
         temp_path = upload_dir / f"{uuid4().hex}{ext}"
-        with open(temp_path, "wb") as f:
-            f.write(await file.read())
+        await anyio.to_thread.run_sync(_save_upload, file, temp_path)
 
         # Step 2: Extract text from file
-        text = ocr_pdf(str(temp_path))
+        text = await anyio.to_thread.run_sync(ocr_pdf, str(temp_path))
 
         if not text.strip():
             return JSONResponse(status_code=400, content={"error": "No extractable text found."})
@@ -33,20 +62,30 @@ async def analyze_document(file: UploadFile = File(...)):
         doc_id = Path(file.filename).stem
 
         # Step 3: Embed & store in Pinecone
-        num_chunks = embed_and_store_chunks(text, doc_id=doc_id)
+        num_chunks = await anyio.to_thread.run_sync(embed_and_store_chunks, text, doc_id)
 
-        # Step 4: Use same text to extract themes
-        chunks = [text[i:i+800] for i in range(0, len(text), 800)]
-        doc_ids = [doc_id] * len(chunks)
-        themes = identify_themes(chunks, doc_ids)
+        # Step 4: Extract themes from the same text in the background
+        job_id = uuid4().hex
+        JOBS.set(job_id, {"status": "pending"}, expire=JOB_TTL)
+        background.add_task(_run_themes, job_id, text, doc_id)
 
         # Step 5: Return results
         result = {
             "filename": file.filename,
             "num_chunks": num_chunks,
-            "themes": themes
+            "job_id": job_id,
+            "status": "pending"
         }
         return JSONResponse(content=result)
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+# Poll theme identification for an analyzed document
+@router.get("/analyze/{job_id}")
+async def get_analysis(job_id: str):
+    job = JOBS.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id."})
+    return JSONResponse(content={"job_id": job_id, **job})
@@ -1,7 +1,10 @@
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
-from backend.app.services.theme_identifier import identify_themes
+from backend.app.services.theme_identifier import identify_themes_stream
+from backend.app.services.theme_worker_pool import theme_worker_pool
 
 router = APIRouter()
 
@@ -19,9 +22,30 @@ async def identify_themes_endpoint(request: ThemeRequest):
     Endpoint for identifying themes from document chunks.
     """
     try:
-        themes = identify_themes(request.chunks, request.doc_ids, request.query)
+        themes = await theme_worker_pool.submit(request.chunks, request.doc_ids, request.query)
         if "error" in themes:
             raise HTTPException(status_code=400, detail=themes["error"])
         return themes
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+# Stream themes as newline-delimited JSON, one theme per line as soon as it is generated
+@router.post("/identify-themes/stream")
+async def identify_themes_stream_endpoint(request: ThemeRequest):
+    """
+    Streaming endpoint for identifying themes from document chunks.
+    """
+    async def ndjson():
+        emitted = 0
+        try:
+            async for name, data in identify_themes_stream(request.chunks, request.doc_ids, request.query):
+                emitted += 1
+                yield orjson.dumps({"theme": name, "data": data}) + b"\n"
+        except Exception as e:
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+            return
+        if not emitted:
+            yield orjson.dumps({"error": "No themes identified"}) + b"\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -2,24 +2,36 @@
 
 import os
 import json
+import time
+import asyncio
+import anyio
+import hashlib
+import orjson
+from collections import OrderedDict
+from functools import partial
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Optional, Dict, List
 from pinecone import Pinecone
-from sentence_transformers import SentenceTransformer
 import openai
-import requests
 from dotenv import load_dotenv
+from backend.app.core.http_client import http_client, get_llm_session
+from backend.app.core.api_keys import load_keys
+from backend.app.services.embedding_cache import embedding_cache
+from backend.app.services.embedding import embed_text, EMBED_MODEL, EMBED_DIM
 
 load_dotenv()
 
 # Load environment variables
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# First key of the OPENAI_API_KEYS / GROQ_API_KEYS pool, else the single-key variable
+OPENAI_API_KEY = (load_keys("OPENAI_API_KEYS", os.getenv("OPENAI_API_KEY")) or [None])[0]
+GROQ_API_KEY = (load_keys("GROQ_API_KEYS", os.getenv("GROQ_API_KEY")) or [None])[0]
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "citation-theme-bot")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
 
+_DEFAULT_MODELS = {"openai": "gpt-4-turbo", "groq": "mixtral-8x7b-32768"}
+
 if not PINECONE_API_KEY:
     raise RuntimeError("Missing PINECONE_API_KEY")
 if LLM_PROVIDER == "openai" and not OPENAI_API_KEY:
@@ -34,6 +46,37 @@ if OPENAI_API_KEY:
 pc = Pinecone(api_key=PINECONE_API_KEY)
 index = pc.Index(PINECONE_INDEX_NAME)
 
+# Query vector used to fetch a general sample when no query is given; queries are
+# embedded with the ingestion model so they match the index dimension
+_ZERO_VEC = [0.0] * EMBED_DIM
+
+# Short-lived cache of Pinecone matches keyed by (query vector hash, top_k)
+_QUERY_CACHE_TTL = 60
+_QUERY_CACHE_SIZE = 128
+_query_cache = OrderedDict()
+
+async def query_index_cached(query_vec: List[float], top_k: int) -> list:
+    digest = hashlib.blake2b(
+        json.dumps(query_vec, separators=(',', ':'), default=str).encode(),
+        digest_size=16
+    ).digest()
+    key = (digest, top_k)
+
+    entry = _query_cache.get(key)
+    if entry is not None and time.monotonic() - entry[0] < _QUERY_CACHE_TTL:
+        _query_cache.move_to_end(key)
+        return entry[1]
+
+    res = await anyio.to_thread.run_sync(partial(
+        index.query, vector=query_vec, top_k=top_k, include_metadata=True
+    ))
+    matches = res.matches
+    _query_cache[key] = (time.monotonic(), matches)
+    _query_cache.move_to_end(key)
+    while len(_query_cache) > _QUERY_CACHE_SIZE:
+        _query_cache.popitem(last=False)
+    return matches
+
 router = APIRouter()
 
 # Request model
@@ -43,7 +86,7 @@ class ThemeRequest(BaseModel):
     model: Optional[str] = None
 
 # LLM call: Groq
-def call_groq_llm(prompt: str, model: str = "mixtral-8x7b-32768") -> str:
+async def call_groq_llm(prompt: str, model: str = "mixtral-8x7b-32768") -> str:
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
@@ -54,13 +97,15 @@ def call_groq_llm(prompt: str, model: str = "mixtral-8x7b-32768") -> str:
         "temperature": 0.4,
         "max_tokens": 1000
     }
-    response = requests.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
+    response = await http_client.post("https://openrouter.ai/api/v1/chat/completions", headers=headers, json=body)
     response.raise_for_status()
     return response.json()["choices"][0]["message"]["content"].strip()
 
 # LLM call: OpenAI
-def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
-    response = openai.ChatCompletion.create(
+async def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
+    # Route acreate through the shared pooled aiohttp session
+    openai.aiosession.set(get_llm_session())
+    response = await openai.ChatCompletion.acreate(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         temperature=0.4,
@@ -69,89 +114,153 @@ def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
     return response.choices[0].message.content.strip()
 
 # Unified LLM call
-def call_llm(prompt: str, provider: str = None, model: str = None) -> str:
+async def call_llm(prompt: str, provider: str = None, model: str = None) -> str:
     provider = provider or LLM_PROVIDER
-    model = model or {"openai": "gpt-4-turbo", "groq": "mixtral-8x7b-32768"}.get(provider)
+    if provider not in _DEFAULT_MODELS:
+        raise ValueError(f"Unsupported provider: {provider}")
+    model = model or _DEFAULT_MODELS[provider]
 
     try:
         if provider == "openai":
-            return call_openai_llm(prompt, model)
-        elif provider == "groq":
-            return call_groq_llm(prompt, model)
-        else:
-            raise ValueError(f"Unsupported provider: {provider}")
+            return await call_openai_llm(prompt, model)
+        return await call_groq_llm(prompt, model)
     except Exception as e:
         print(f"Theme LLM error: {e}")
         raise RuntimeError("Theme extraction failed.")
 
+# Drop near-duplicate excerpts and truncate the rest
+def dedupe_excerpts(chunks: List[tuple], max_chars: int = 500) -> List[tuple]:
+    seen = set()
+    result = []
+    for text, doc_id in chunks:
+        h = hash(text[:200].strip().lower())
+        if h in seen:
+            continue
+        seen.add(h)
+        result.append((text.strip()[:max_chars], doc_id))
+    return result
+
+# Fixed prompt fragments; only the query and excerpts vary per call
+HEADER_PROMPT = (
+    "You are an AI assistant specializing in document research. "
+    "Identify 2–3 major themes from the following excerpts.\n"
+)
+
+FOOTER_PROMPT = (
+    "Extract 2–3 key themes.\n"
+    "Each theme should include:\n"
+    "- A short title\n"
+    "- A 2–3 sentence summary\n"
+    "- A list of supporting document IDs\n"
+    "Return response in this JSON format:\n"
+    "{\n"
+    "  \"Theme 1\": {\"summary\": \"...\", \"docs\": [\"DOC001\", \"DOC002\"]},\n"
+    "  \"Theme 2\": {\"summary\": \"...\", \"docs\": [\"DOC003\"]}\n"
+    "}"
+)
+
+# Build prompt for theme extraction, stopping once the token budget is spent
+def build_theme_prompt(chunks: List[tuple], query: Optional[str] = None, token_budget: int = 3000) -> str:
+    parts = [HEADER_PROMPT]
+    if query:
+        parts.append(f"User Query: {query}\n\n")
+    parts.append("Excerpts:\n")
+
+    used = 0
+    for i, (text, doc_id) in enumerate(chunks):
+        used += len(text) // 4  # rough token estimate
+        if i > 0 and used > token_budget:
+            break
+        parts.append(f"Excerpt {i+1} (Doc: {doc_id}): {text.strip()}\n\n")
+
+    parts.append(FOOTER_PROMPT)
+    return "".join(parts)
+
+# Parse LLM output into a themes dict
+def parse_themes(content: str) -> Dict:
+    # Attempt to parse clean JSON
+    try:
+        return orjson.loads(content.encode())
+    except orjson.JSONDecodeError:
+        # Try extracting inner JSON
+        try:
+            start = content.find('{')
+            end = content.rfind('}') + 1
+            return orjson.loads(content[start:end].encode())
+        except:
+            return {"error": "Failed to parse AI output", "raw_output": content}
+
+# Themes returned by /themes/, per the "2-3 themes" prompt
+MAX_THEMES = 3
+
+# Merge themes from several sub-prompts, combining docs of same-named themes and keeping
+# the MAX_THEMES found by the most sub-prompts (then with the most supporting docs)
+def merge_themes(results: List[Dict]) -> Dict:
+    parsed = [r for r in results if isinstance(r, dict) and "error" not in r]
+    if not parsed:
+        return results[0]
+
+    merged = {}
+    counts = {}
+    for themes in parsed:
+        for name, data in themes.items():
+            counts[name] = counts.get(name, 0) + 1
+            if name not in merged:
+                merged[name] = data
+            elif isinstance(merged[name], dict) and isinstance(data, dict):
+                docs = merged[name].setdefault("docs", [])
+                docs.extend(d for d in data.get("docs", []) if d not in docs)
+
+    def rank(name):
+        data = merged[name]
+        return counts[name], len(data.get("docs", [])) if isinstance(data, dict) else 0
+
+    return {name: merged[name] for name in sorted(merged, key=rank, reverse=True)[:MAX_THEMES]}
+
 # Endpoint
 @router.post("/themes/")
 async def get_themes(request: ThemeRequest):
     try:
-        # Load embedding model for dummy query if needed
-        embedder = SentenceTransformer("all-MiniLM-L6-v2")
-
-        # Embed query or use [0.0] * 384 to fetch general sample
-        if request.query:
-            query_vec = embedder.encode(request.query).tolist()
+        # Embed query or use the zero vector to fetch general sample
+        if not request.query:
+            query_vec = _ZERO_VEC
         else:
-            query_vec = [0.0] * 384
+            query_vec = await anyio.to_thread.run_sync(partial(
+                embedding_cache.get_or_compute,
+                request.query,
+                lambda t: embed_text(t).tolist(),
+                model=EMBED_MODEL
+            ))
 
         # Retrieve top_k document chunks
-        res = index.query(
-            vector=query_vec,
-            top_k=request.top_k,
-            include_metadata=True
-        )
-
-        # Format chunks
-        chunks = [
+        matches = await query_index_cached(query_vec, request.top_k)
+
+        # Format chunks, dropping duplicates and overly long excerpts
+        chunks = dedupe_excerpts([
             (match.metadata.get("text", ""), match.metadata.get("doc_id", "UNKNOWN"))
-            for match in res.matches if "text" in match.metadata
-        ]
+            for match in matches if "text" in match.metadata
+        ])
 
         if not chunks:
             return {"error": "No document excerpts available for theme analysis."}
 
-        # Build prompt for theme extraction
-        prompt = (
-            "You are an AI assistant specializing in document research. "
-            "Identify 2–3 major themes from the following excerpts.\n"
-        )
-        if request.query:
-            prompt += f"User Query: {request.query}\n\n"
-        prompt += "Excerpts:\n"
-
+        # Fan out over excerpt groups when there are too many for one prompt
         max_excerpts = 20
-        for i, (text, doc_id) in enumerate(chunks[:max_excerpts]):
-            prompt += f"Excerpt {i+1} (Doc: {doc_id}): {text.strip()}\n\n"
-
-        prompt += (
-            "Extract 2–3 key themes.\n"
-            "Each theme should include:\n"
-            "- A short title\n"
-            "- A 2–3 sentence summary\n"
-            "- A list of supporting document IDs\n"
-            "Return response in this JSON format:\n"
-            "{\n"
-            "  \"Theme 1\": {\"summary\": \"...\", \"docs\": [\"DOC001\", \"DOC002\"]},\n"
-            "  \"Theme 2\": {\"summary\": \"...\", \"docs\": [\"DOC003\"]}\n"
-            "}"
-        )
-
-        content = call_llm(prompt, model=request.model)
-
-        # Attempt to parse clean JSON
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # Try extracting inner JSON
-            try:
-                start = content.find('{')
-                end = content.rfind('}') + 1
-                return json.loads(content[start:end])
-            except:
-                return {"error": "Failed to parse AI output", "raw_output": content}
+        if len(chunks) > max_excerpts * 2:
+            groups = [chunks[i:i + max_excerpts] for i in range(0, len(chunks), max_excerpts)]
+        else:
+            groups = [chunks[:max_excerpts]]
+
+        prompts = [build_theme_prompt(group, request.query) for group in groups]
+        results = await asyncio.gather(*[call_llm(p, model=request.model) for p in prompts], return_exceptions=True)
+
+        # Skip groups whose LLM call failed; fail only if every group did
+        contents = [r for r in results if not isinstance(r, BaseException)]
+        if not contents:
+            raise results[0]
+        if len(contents) == 1:
+            return parse_themes(contents[0])
+        return merge_themes([parse_themes(c) for c in contents])
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
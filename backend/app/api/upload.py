@@ -1,9 +1,15 @@
 import os
+import re
 import shutil
+import asyncio
+import anyio
+from functools import partial
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from pathlib import Path
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, List, Optional, Tuple
 from uuid import uuid4
+import numpy as np
 from PyPDF2 import PdfReader
 from PIL import Image
 import pytesseract
@@ -12,15 +18,33 @@ import docx2txt
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 from sentence_transformers import SentenceTransformer
+from backend.app.services.onnx_encoder import OnnxEncoder, HAS_ONNXRUNTIME
 
 try:
     from pdf2image import convert_from_path
 except ImportError:
     convert_from_path = None  # Optional
 
+# PyMuPDF rasterizes pages in-process; pdf2image (a Poppler subprocess per call) is the fallback
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
 # Load environment
 load_dotenv()
 
+# Embedding model (ONNX Runtime when an exported model dir is configured)
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR")
+if ONNX_MODEL_DIR and HAS_ONNXRUNTIME:
+    embedder = OnnxEncoder(ONNX_MODEL_DIR)
+else:
+    embedder = SentenceTransformer(os.getenv("EMBED_MODEL", "all-mpnet-base-v2"))
+EMB_DIM = embedder.get_sentence_embedding_dimension()
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+# Precision used when sending vectors to Pinecone ("float16" or "float32")
+EMBED_UPSERT_DTYPE = np.dtype(os.getenv("EMBED_UPSERT_DTYPE", "float16"))
+
 # Pinecone setup
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_index_name = os.getenv("PINECONE_INDEX_NAME", "citation-theme-bot")
@@ -32,14 +56,13 @@ pc = Pinecone(api_key=pinecone_api_key)
 if pinecone_index_name not in pc.list_indexes().names():
     pc.create_index(
         name=pinecone_index_name,
-        dimension=2048,
+        dimension=EMB_DIM,
         metric="cosine",
         spec=ServerlessSpec(cloud="aws", region="us-east-1")
     )
 index = pc.Index(pinecone_index_name)
-
-# Embedding model
-embedder = SentenceTransformer("all-mpnet-base-v2")
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", 8))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
 
 # Upload path
 DATA_DIR = Path(__file__).parent.parent.parent / "data"
@@ -52,27 +75,71 @@ router = APIRouter()
 # ========== File Handling & Text Extraction ==========
 
 def save_upload_file(file: UploadFile) -> Path:
-    """Save uploaded file to server and return the file path."""
-    file_path = Path("uploads") / file.filename
+    """Save uploaded file to server under a unique name and return the file path."""
+    file_path = Path("uploads") / f"{uuid4().hex}_{Path(file.filename).name}"
+    file_path.parent.mkdir(parents=True, exist_ok=True)
     with open(file_path, "wb") as f:
-        f.write(file.file.read())
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
     return file_path
 
+def _render_pages(pdf_path: Path, pages: List[int]) -> Iterator[Tuple[int, Image.Image]]:
+    """Lazily rasterize the given (sorted, 0-based) pages at 200 DPI."""
+    if fitz is not None:
+        with fitz.open(str(pdf_path)) as doc:
+            for i in pages:
+                pix = doc[i].get_pixmap(dpi=200)
+                yield i, Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        return
+
+    # One pdf2image call per run of consecutive pages, at most OCR_WORKERS pages each
+    run = []
+    for i in pages + [None]:
+        if run and (i is None or i != run[-1] + 1 or len(run) == OCR_WORKERS):
+            images = convert_from_path(str(pdf_path), first_page=run[0]+1, last_page=run[-1]+1)
+            yield from zip(run, images)
+            run = []
+        if i is not None:
+            run.append(i)
+
+
+def _ocr_pdf_pages(pdf_path: Path, pages: List[int]) -> Dict[int, str]:
+    """
+    OCR pages in the thread pool while rendering them in this thread (PyMuPDF is not
+    thread-safe), keeping at most 2 * OCR_WORKERS page images in memory.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=OCR_WORKERS) as executor:
+        pending = {}
+        for i, img in _render_pages(pdf_path, pages):
+            pending[executor.submit(pytesseract.image_to_string, img)] = i
+            if len(pending) >= 2 * OCR_WORKERS:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        for future, i in pending.items():
+            results[i] = future.result()
+    return results
+
+
 def extract_text_from_pdf(pdf_path: Path) -> List[dict]:
     try:
         reader = PdfReader(str(pdf_path))
-        texts = []
+        texts = {}
+        empty_pages = []
         for i, page in enumerate(reader.pages):
             text = page.extract_text()
             if text and text.strip():
-                texts.append({"text": text.strip(), "ref": f"page-{i+1}"})
-            elif convert_from_path:
-                images = convert_from_path(str(pdf_path), first_page=i+1, last_page=i+1)
-                if images:
-                    ocr_text = pytesseract.image_to_string(images[0])
-                    if ocr_text.strip():
-                        texts.append({"text": ocr_text.strip(), "ref": f"page-{i+1}-ocr"})
-        return texts
+                texts[i] = {"text": text.strip(), "ref": f"page-{i+1}"}
+            else:
+                empty_pages.append(i)
+
+        # OCR pages without text, rendering only those pages
+        if empty_pages and (fitz is not None or convert_from_path):
+            for i, ocr_text in _ocr_pdf_pages(pdf_path, empty_pages).items():
+                if ocr_text.strip():
+                    texts[i] = {"text": ocr_text.strip(), "ref": f"page-{i+1}-ocr"}
+
+        return [texts[i] for i in sorted(texts)]
     except Exception as e:
         raise RuntimeError(f"PDF extraction failed: {e}")
 
@@ -102,45 +169,89 @@ def extract_text_from_image(file_path: Path) -> List[dict]:
         raise RuntimeError(f"Image OCR failed: {e}")
 
 
-def extract_text_from_txt(file_path: str) -> List[dict]:
+def extract_text_from_txt(file_path: str, ref: Optional[str] = None) -> List[dict]:
     """Extract text from a plain text file."""
     with open(file_path, "r", encoding="utf-8") as file:
         text = file.read()
-    return [{"text": text, "ref": file_path}]
+    return [{"text": text, "ref": ref or str(file_path)}]
 
 
-# ========== Text Chunking & Embedding ==========
+def extract_texts(file_path: Path, filename: str) -> Optional[List[dict]]:
+    """Extract text based on file type. Returns None for unsupported types."""
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return extract_text_from_pdf(file_path)
+    elif name.endswith((".docx", ".doc")):
+        return extract_text_from_docx(file_path)
+    elif name.endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
+        return extract_text_from_image(file_path)
+    elif name.endswith(".txt"):
+        return extract_text_from_txt(file_path, ref=filename)
+    return None
 
 
-def chunk_text(text: str, max_length: int = 500) -> List[str]:
-    if len(text) <= max_length:
-        return [text]
+async def _process_one(file: UploadFile, saved_files: List[Path]) -> Tuple[str, Optional[List[dict]]]:
+    """Save one upload and extract its text off the event loop."""
+    file_path = await anyio.to_thread.run_sync(save_upload_file, file)
+    saved_files.append(file_path)
+    texts = await anyio.to_thread.run_sync(extract_texts, file_path, file.filename)
+    return file.filename, texts
 
-    sentences = text.split(". ")
-    chunks, current_chunk, length = [], [], 0
 
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if not sentence.endswith("."):
-            sentence += "."
-        if length + len(sentence) <= max_length:
-            current_chunk.append(sentence)
-            length += len(sentence)
-        else:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [sentence]
-            length = len(sentence)
+# ========== Text Chunking & Embedding ==========
 
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+_SENT_RE = re.compile(r'[^.!?]+[.!?]+\s*')
 
-    return chunks
+
+def chunk_text(text: str, max_length: int = 500) -> Iterator[str]:
+    """Yield sentence-aligned chunks as slices of the original text."""
+    if len(text) <= max_length:
+        yield text
+        return
+
+    cur_start = 0
+    for match in _SENT_RE.finditer(text):
+        if match.end() - cur_start > max_length and match.start() > cur_start:
+            chunk = text[cur_start:match.start()].strip()
+            if chunk:
+                yield chunk
+            cur_start = match.start()
+
+    tail = text[cur_start:].strip()
+    if tail:
+        yield tail
 
 
 def embed_text(text: str) -> List[float]:
     return embedder.encode(text).tolist()
 
 
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Encode a list of texts in batches with a single model call."""
+    vectors = embedder.encode(
+        texts,
+        batch_size=EMBED_BATCH_SIZE,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+        normalize_embeddings=True
+    )
+    return vectors.astype(np.float32, copy=False)
+
+
+async def upsert_vectors(vectors: List[tuple], batch_size: int = 100) -> None:
+    """Upsert vectors to Pinecone in concurrent batches."""
+    sem = asyncio.Semaphore(UPSERT_CONCURRENCY)
+
+    async def _upsert(batch):
+        async with sem:
+            await anyio.to_thread.run_sync(partial(index.upsert, vectors=batch))
+
+    await asyncio.gather(*[
+        _upsert(vectors[i:i + batch_size])
+        for i in range(0, len(vectors), batch_size)
+    ])
+
+
 # ========== Upload Endpoint ==========
 @router.post("/upload/")
 async def upload_files(
@@ -148,30 +259,24 @@ async def upload_files(
     chunk_size: Optional[int] = Form(500)
 ):
     saved_files = []
+    pending = []
     embeddings = []
     total_chunks = 0
     processed_files = []
 
     try:
-        for file in files:
-            file_path = save_upload_file(file)
-            saved_files.append(file_path)
-            filename = file.filename
-
-            # Extract text based on file type
-            if filename.lower().endswith(".pdf"):
-                texts = extract_text_from_pdf(file_path)
-            elif filename.lower().endswith((".docx", ".doc")):
-                texts = extract_text_from_docx(file_path)
-            elif filename.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tiff")):
-                texts = extract_text_from_image(file_path)
-            elif filename.lower().endswith(".txt"):
-                texts = extract_text_from_txt(file_path)
-            else:
-                continue  # Unsupported file type
-
+        # Save and extract all files concurrently
+        results = await asyncio.gather(
+            *[_process_one(file, saved_files) for file in files],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        for filename, texts in results:
             if not texts:
-                continue
+                continue  # Unsupported file type or no text
 
             processed_files.append(filename)
 
@@ -180,27 +285,33 @@ async def upload_files(
                 raw_text = text_item["text"]
                 ref = text_item["ref"]
 
-                chunks = chunk_text(raw_text, chunk_size)
+                chunks = list(chunk_text(raw_text, chunk_size))
                 for i, chunk in enumerate(chunks):
                     if len(chunk.strip()) < 20:
                         continue
                     chunk_ref = f"{ref}-chunk-{i+1}" if len(chunks) > 1 else ref
-                    embedding = embed_text(chunk)  # This will call the embed function
                     meta = {
                         "doc_id": filename,
                         "ref": chunk_ref,
                         "text": chunk
                     }
                     vector_id = f"{filename}_{chunk_ref}".replace(" ", "_")
-                    embeddings.append((vector_id, embedding, meta))
+                    pending.append((vector_id, chunk, meta))
                     total_chunks += 1
 
+        # Embed all collected chunks in one batched call
+        if pending:
+            vectors = await anyio.to_thread.run_sync(embed_texts, [p[1] for p in pending])
+            vectors = vectors.astype(EMBED_UPSERT_DTYPE, copy=False)
+            if vectors.shape[1] != EMB_DIM:
+                raise RuntimeError(f"Embedding dim {vectors.shape[1]} does not match index dim {EMB_DIM}")
+            # Convert row by row to avoid one large nested-list temporary
+            for (vid, _, meta), vec in zip(pending, vectors):
+                embeddings.append((vid, vec.tolist(), meta))
+
         # Upsert the embeddings to Pinecone (or your vector DB)
         if embeddings:
-            batch_size = 100
-            for i in range(0, len(embeddings), batch_size):
-                # Assuming `index` is already initialized
-                index.upsert(vectors=embeddings[i:i + batch_size])
+            await upsert_vectors(embeddings)
 
         return {
             "message": f"Uploaded {len(processed_files)} files. {total_chunks} chunks embedded.",
@@ -4,14 +4,18 @@ import os
 import json
 import pandas as pd
 from io import BytesIO
+from pathlib import Path
 import base64
+import hashlib
 from dotenv import load_dotenv
 import time
 from PIL import Image
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import networkx as nx
 from streamlit_lottie import st_lottie
-import requests
+from requests.adapters import HTTPAdapter
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +26,20 @@ UPLOAD_ENDPOINT = f"{API_BASE_URL}/upload"
 QUERY_ENDPOINT = f"{API_BASE_URL}/api/query"
 THEMES_ENDPOINT = f"{API_BASE_URL}/themes"
 ANALYZE_ENDPOINT = f"{API_BASE_URL}/analyze"
+# (connect, read) timeout for API calls
+REQUEST_TIMEOUT = (3, 120)
+
+
+# Shared HTTP session so API calls reuse pooled connections; cached as a resource so
+# Streamlit reruns don't build (and leak) a new pool each time
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 # Initialize session states
 if 'chat_history' not in st.session_state:
@@ -32,6 +50,8 @@ if 'current_themes' not in st.session_state:
     st.session_state.current_themes = {}
 if 'document_filter' not in st.session_state:
     st.session_state.document_filter = []
+if 'last_uploaded_hash' not in st.session_state:
+    st.session_state.last_uploaded_hash = None
 
 # App layout configuration
 st.set_page_config(
@@ -46,152 +66,30 @@ st.set_page_config(
     }
 )
 
-# Set theme to dark mode
-st.markdown("""
-    <script>
-        var elements = window.parent.document.querySelectorAll('.stApp');
-        elements[0].classList.add('dark');
-    </script>
-    """, unsafe_allow_html=True)
+# Custom CSS for styling with dark theme (base colors live in .streamlit/config.toml)
+CSS_PATH = Path(__file__).parent / "static" / "theme.css"
+
+
+@st.cache_resource
+def load_css():
+    return f"<style>{CSS_PATH.read_text()}</style>"
 
-# Custom CSS for styling with dark theme
-st.markdown("""
-<style>
-    .main {
-        background-color: #0e1117;
-        color: #fafafa;
-    }
-    .stApp {
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-    .st-emotion-cache-18ni7ap {
-        background-color: #1e2130;
-        border-radius: 10px;
-        padding: 20px;
-        box-shadow: 0 2px 10px rgba(0,0,0,0.2);
-    }
-    .chat-message {
-        padding: 15px;
-        border-radius: 10px;
-        margin-bottom: 10px;
-        display: flex;
-        flex-direction: column;
-    }
-    .chat-message.user {
-        background-color: #263145;
-        border-left: 5px solid #4c8bf5;
-    }
-    .chat-message.assistant {
-        background-color: #1e2936;
-        border-left: 5px solid #28a745;
-    }
-    .chat-message .message-content {
-        margin-left: 10px;
-    }
-    .citation {
-        font-size: 0.8em;
-        color: #a3a8b8;
-        margin-top: 5px;
-    }
-    .theme-card {
-        background-color: #1e2130;
-        border-radius: 10px;
-        padding: 15px;
-        box-shadow: 0 2px 5px rgba(0,0,0,0.2);
-        margin-bottom: 15px;
-    }
-    .theme-title {
-        font-weight: bold;
-        color: #e0e0e0;
-        margin-bottom: 10px;
-    }
-    .theme-docs {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 5px;
-    }
-    .doc-chip {
-        background-color: #203040;
-        padding: 2px 8px;
-        border-radius: 15px;
-        font-size: 0.8em;
-        color: #4caf9e;
-    }
-    .file-upload-area {
-        border: 2px dashed #444;
-        padding: 30px;
-        text-align: center;
-        border-radius: 10px;
-        background-color: #1a1d24;
-        cursor: pointer;
-        transition: all 0.3s;
-    }
-    .file-upload-area:hover {
-        border-color: #4c8bf5;
-        background-color: #182035;
-    }
-    .doc-table {
-        margin-top: 20px;
-    }
-    .custom-tab {
-        border-bottom: 2px solid transparent;
-    }
-    .custom-tab.selected {
-        border-bottom: 2px solid #4c8bf5;
-        font-weight: bold;
-    }
-    .header-container {
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-        padding: 10px 0;
-        border-bottom: 1px solid #333;
-        margin-bottom: 20px;
-    }
-    .logo-title {
-        display: flex;
-        align-items: center;
-        gap: 10px;
-    }
-    .btn-primary {
-        background-color: #4c8bf5;
-        color: white;
-        border: none;
-        padding: 8px 16px;
-        border-radius: 5px;
-        cursor: pointer;
-    }
-    .btn-primary:hover {
-        background-color: #3a70d0;
-    }
-    /* Adjust dataframe styling for dark mode */
-    div[data-testid="stDataFrame"] table {
-        background-color: #1e2130;
-        color: #e0e0e0;
-    }
-    div[data-testid="stDataFrame"] th {
-        background-color: #273046;
-        color: #ffffff;
-    }
-    div[data-testid="stDataFrame"] td {
-        background-color: #1e2130;
-        color: #e0e0e0;
-    }
-</style>
-""", unsafe_allow_html=True)
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 
 # Helper Functions
 def load_lottie_url(url):
-    r = requests.get(url)
+    r = get_session().get(url, timeout=REQUEST_TIMEOUT)
     if r.status_code != 200:
         return None
     return r.json()
 
 
-def create_citation_network(themes):
+@st.cache_data(show_spinner=False)
+def create_citation_network(themes_json):
     """Create a network graph of themes and documents"""
+    themes = json.loads(themes_json)
     G = nx.Graph()
 
     # Check if themes is a dictionary
@@ -227,22 +125,31 @@ def create_citation_network(themes):
     return G
 
 
-def plot_citation_network(themes):
-    """Plot the citation network using matplotlib"""
-    if not themes:
+@st.cache_data(show_spinner=False)
+def plot_citation_network(themes_json):
+    """Plot the citation network using matplotlib and return it as PNG bytes (cached per themes JSON)"""
+    if not json.loads(themes_json):
         return None
 
     # Add error handling when creating network
     try:
-        G = create_citation_network(themes)
+        G = create_citation_network(themes_json)
 
         # Check if we have nodes
         if G.number_of_nodes() == 0:
             st.warning("No nodes available to create visualization. Check theme data format.")
             return None
 
-        # Create positions
-        pos = nx.spring_layout(G, k=0.5)
+        # Create positions; use Graphviz sfdp for large graphs when available
+        pos = None
+        if G.number_of_nodes() > 100:
+            try:
+                from networkx.drawing.nx_agraph import graphviz_layout
+                pos = graphviz_layout(G, prog="sfdp")
+            except ImportError:
+                pass
+        if pos is None:
+            pos = nx.spring_layout(G, k=0.5, iterations=15, seed=42)
 
         # Create the figure with dark background
         plt.style.use('dark_background')
@@ -271,9 +178,13 @@ def plot_citation_network(themes):
         nx.draw_networkx_labels(G, pos, labels=doc_labels, font_size=10, font_color='white')
 
         plt.axis('off')
-        plt.tight_layout()
+        fig.subplots_adjust(left=0.02, right=0.98, bottom=0.02, top=0.98)
 
-        return fig
+        # Rasterize once so reruns only ship the cached PNG bytes
+        buf = BytesIO()
+        fig.savefig(buf, format="png", dpi=90, facecolor=fig.get_facecolor())
+        plt.close(fig)
+        return buf.getvalue()
     except Exception as e:
         st.error(f"Error creating citation network visualization: {str(e)}")
         return None
@@ -283,7 +194,7 @@ def upload_files(files):
     """Upload files to the API server"""
     file_objects = [('files', (file.name, file.getvalue(), file.type)) for file in files]
     try:
-        response = requests.post(UPLOAD_ENDPOINT, files=file_objects)
+        response = get_session().post(UPLOAD_ENDPOINT, files=file_objects, timeout=REQUEST_TIMEOUT)
         return response.json()
     except Exception as e:
         st.error(f"Error uploading files: {str(e)}")
@@ -294,7 +205,7 @@ def analyze_document(file):
     """Analyze a single document for themes"""
     try:
         files = {'file': (file.name, file.getvalue(), file.type)}
-        response = requests.post(ANALYZE_ENDPOINT, files=files)
+        response = get_session().post(ANALYZE_ENDPOINT, files=files, timeout=REQUEST_TIMEOUT)
         return response.json()
     except Exception as e:
         st.error(f"Error analyzing document: {str(e)}")
@@ -304,9 +215,10 @@ def analyze_document(file):
 def query_documents(query_text, top_k=5):
     """Query the document database"""
     try:
-        response = requests.post(
+        response = get_session().post(
             QUERY_ENDPOINT,
-            json={"q": query_text, "top_k": top_k}
+            json={"q": query_text, "top_k": top_k},
+            timeout=REQUEST_TIMEOUT
         )
         return response.json()
     except Exception as e:
@@ -314,12 +226,14 @@ def query_documents(query_text, top_k=5):
         return None
 
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_themes(query=None, top_k=100):
-    """Get themes from the document database"""
+    """Get themes from the document database (cached per query for 60s)"""
     try:
-        response = requests.post(
+        response = get_session().post(
             THEMES_ENDPOINT,
-            json={"query": query, "top_k": top_k}
+            json={"query": query, "top_k": top_k},
+            timeout=REQUEST_TIMEOUT
         )
         result = response.json()
 
@@ -342,6 +256,14 @@ def get_themes(query=None, top_k=100):
         return {}
 
 
+def hash_uploads(files):
+    """Hash the ids, names and sizes of a batch of uploaded files (contents are not copied)"""
+    h = hashlib.sha1()
+    for file in files:
+        h.update(f"{getattr(file, 'file_id', '')}\0{file.name}\0{file.size}\0".encode())
+    return h.hexdigest()
+
+
 def format_answer_with_citations(answer, citations):
     """Format answer text with citation highlights"""
     if not citations:
@@ -407,10 +329,14 @@ def main():
                                         "size": file.size,
                                         "type": file.type
                                     })
-                            # Update themes
-                            themes = get_themes()
-                            if themes and not isinstance(themes, dict) or "error" not in themes:
-                                st.session_state.current_themes = themes
+                            # Update themes only when a new set of files was processed
+                            upload_hash = hash_uploads(uploaded_files)
+                            if upload_hash != st.session_state.last_uploaded_hash:
+                                st.session_state.last_uploaded_hash = upload_hash
+                                get_themes.clear()
+                                themes = get_themes()
+                                if themes and not isinstance(themes, dict) or "error" not in themes:
+                                    st.session_state.current_themes = themes
 
         with col2:
             lottie_url = "https://assets5.lottiefiles.com/packages/lf20_qp1q7mct.json"
@@ -592,9 +518,9 @@ def main():
             themes = st.session_state.current_themes
 
             if isinstance(themes, dict) and len(themes) > 0:
-                fig = plot_citation_network(themes)
-                if fig:
-                    st.pyplot(fig)
+                png = plot_citation_network(json.dumps(themes, sort_keys=True))
+                if png:
+                    st.image(png, use_column_width=True)
 
                     # Legend
                     st.markdown("""
@@ -0,0 +1,10 @@
+# backend/app/core/api_keys.py
+
+import os
+from typing import List, Optional
+
+
+def load_keys(list_var: str, single_key: Optional[str]) -> List[str]:
+    """Read a comma-separated key list, falling back to the single-key variable."""
+    keys = [k.strip() for k in os.getenv(list_var, "").split(",") if k.strip()]
+    return keys or ([single_key] if single_key else [])
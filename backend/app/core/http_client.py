@@ -0,0 +1,30 @@
+# backend/app/core/http_client.py
+
+from typing import Optional
+import httpx
+import aiohttp
+
+# Shared async HTTP client with keep-alive connection pooling
+http_client = httpx.AsyncClient(
+    http2=True,
+    timeout=60.0,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+)
+
+# Shared aiohttp session for async LLM provider calls: the openai client's (openai 0.28
+# otherwise opens a new session per request) and Groq's; created lazily inside the running event loop
+_llm_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_llm_session() -> aiohttp.ClientSession:
+    global _llm_session
+    if _llm_session is None or _llm_session.closed:
+        _llm_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=128, keepalive_timeout=60)
+        )
+    return _llm_session
+
+
+async def close_llm_session() -> None:
+    if _llm_session is not None and not _llm_session.closed:
+        await _llm_session.close()
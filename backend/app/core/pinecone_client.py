@@ -1,6 +1,7 @@
 # backend/app/core/pinecone_client.py
 
 import os
+from functools import lru_cache
 from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
 
@@ -10,7 +11,8 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "citation-theme-bot")
 PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
-PINECONE_DIMENSION = int(os.getenv("PINECONE_DIMENSION", 2048))  # match your embedding model
+PINECONE_DIMENSION = int(os.getenv("PINECONE_DIMENSION", 768))  # match your embedding model
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", 8))  # concurrent async_req calls
 
 if not PINECONE_API_KEY:
     raise RuntimeError("Missing PINECONE_API_KEY in environment")
@@ -18,9 +20,8 @@ if not PINECONE_API_KEY:
 # Init Pinecone client
 pc = Pinecone(api_key=PINECONE_API_KEY)
 
-# Index accessor
-def get_index(index_name: str = PINECONE_INDEX_NAME, dimension: int = PINECONE_DIMENSION) -> pc.Index:
-    # Create index if not present
+# Create index if not present; call once at startup
+def ensure_index(index_name: str = PINECONE_INDEX_NAME, dimension: int = PINECONE_DIMENSION) -> None:
     if index_name not in pc.list_indexes().names():
         pc.create_index(
             name=index_name,
@@ -28,4 +29,8 @@ def get_index(index_name: str = PINECONE_INDEX_NAME, dimension: int = PINECONE_D
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region=PINECONE_REGION)
         )
-    return pc.Index(index_name)
+
+# Index accessor, memoized so repeated lookups don't rebuild the handle
+@lru_cache(maxsize=4)
+def get_index(index_name: str = PINECONE_INDEX_NAME) -> pc.Index:
+    return pc.Index(index_name, pool_threads=PINECONE_POOL_THREADS)
@@ -1,5 +1,10 @@
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
+import anyio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -9,24 +14,52 @@ from backend.app.api.routes import router as main_router
 from backend.app.api.upload import router as upload_router
 from backend.app.api.query import router as query_router
 from backend.app.api.themes import router as themes_router
+from backend.app.api.theme_identifer import router as theme_identifier_router
+from backend.app.core.http_client import http_client, close_llm_session
+from backend.app.core.pinecone_client import ensure_index, PINECONE_INDEX_NAME
+from backend.app.services.embedding import EMBED_DIM
+from backend.app.services.theme_worker_pool import theme_worker_pool
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
+# Configure logging; records are queued and written to stderr by a listener thread
+_log_queue = queue.Queue(-1)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     handlers=[
-        logging.StreamHandler()
+        logging.handlers.QueueHandler(_log_queue)
     ]
 )
+logger = logging.getLogger(__name__)
+
+# Startup/shutdown hooks
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Allow more concurrent blocking calls (OCR, embedding, Pinecone) in worker threads
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("THREAD_POOL_SIZE", 100))
+    # Create the Pinecone index once, sized to the embedding model
+    ensure_index(PINECONE_INDEX_NAME, dimension=EMBED_DIM)
+    # Start the background theme identification workers
+    theme_worker_pool.start()
+    yield
+    await theme_worker_pool.stop()
+    # Close pooled HTTP connections
+    await http_client.aclose()
+    await close_llm_session()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Document Research & Theme Identification API",
     description="API for document analysis, theme identification, and Q&A",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -43,13 +76,16 @@ app.include_router(main_router, prefix="/api")
 app.include_router(upload_router, prefix="/api")
 app.include_router(query_router, prefix="/api")
 app.include_router(themes_router, prefix="/api")
+app.include_router(theme_identifier_router, prefix="/api")
 
 # Request logging middleware
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logging.info(f"Request: {request.method} {request.url}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return await call_next(request)
+    logger.debug("Request: %s %s", request.method, request.url)
     response = await call_next(request)
-    logging.info(f"Response: {response.status_code}")
+    logger.debug("Response: %s", response.status_code)
     return response
 
 # Root endpoint
@@ -64,5 +100,14 @@ async def root():
 # Running the application
 if __name__ == "__main__":
     import uvicorn
+    import importlib.util
+
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    # Auto-reload only in development; reload and multiple workers are mutually exclusive.
+    # One worker unless WEB_CONCURRENCY is set: the theme worker pool and in-memory caches are per process
+    dev = bool(int(os.getenv("DEV", "0")))
+    workers = 1 if dev else int(os.getenv("WEB_CONCURRENCY", 1))
+    # uvloop/httptools are optional (uvloop is unavailable on Windows)
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "auto"
+    http = "httptools" if importlib.util.find_spec("httptools") else "auto"
+    uvicorn.run("main:app", host="0.0.0.0", port=port, loop=loop, http=http, workers=workers, reload=dev)
\ No newline at end of file
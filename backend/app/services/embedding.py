@@ -1,47 +1,89 @@
 import os
-from typing import List, Dict, Any
+import hashlib
+from typing import Iterator, List, Dict, Any, Union
+import numpy as np
+import torch
+import diskcache
 from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
 from dotenv import load_dotenv
+from backend.app.core.pinecone_client import get_index
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Pinecone
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "citation-theme-bot")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-mpnet-base-v2")
 
-if not PINECONE_API_KEY:
-    raise RuntimeError("Missing PINECONE_API_KEY")
+# Initialize SentenceTransformer model (FP16 on GPU when available)
+device = "cuda" if torch.cuda.is_available() else "cpu"
+model = SentenceTransformer(EMBED_MODEL, device=device)
+if device == "cuda":
+    model.half()
+EMBED_DIM = model.get_sentence_embedding_dimension()
 
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX_NAME)
+# Warm up so the first request doesn't pay the cold-start cost
+model.encode(["warmup"] * 8, batch_size=8, show_progress_bar=False)
 
-# Initialize SentenceTransformer model
-model = SentenceTransformer("all-mpnet-base-v2")
+# On-disk embedding cache keyed by content hash
+embed_cache = diskcache.Cache(os.getenv("EMBED_CACHE_DIR", ".embed_cache"))
 
+# Initialize Pinecone (the index is created at app startup via ensure_index)
+index = get_index(PINECONE_INDEX_NAME)
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
     """
-    Split text into chunks with specified size and overlap.
+    Lazily split text into chunks with specified size and overlap.
+    Size filtering is left to the caller so no tail content is dropped here.
     """
-    if len(text) <= chunk_size:
-        return [text]
+    n = len(text)
+    if n <= chunk_size:
+        yield text
+        return
 
-    chunks = []
-    for i in range(0, len(text), chunk_size - overlap):
-        chunk = text[i:i + chunk_size]
-        if len(chunk) >= 100:  # Minimum chunk size to avoid tiny chunks
-            chunks.append(chunk)
+    step = chunk_size - overlap
+    for start in range(0, n, step):
+        yield text[start:min(start + chunk_size, n)]
+        # Stop once a window reaches the end; later starts would lie inside it
+        if start + chunk_size >= n:
+            break
 
-    return chunks
 
+def embed_text(text: Union[str, List[str]], batch_size: int = 64) -> np.ndarray:
+    """
+    Create embeddings for a text or a list of texts using SentenceTransformer.
+    A list is encoded in batches with a single call. Vectors are L2-normalized
+    float32 (the FP16 GPU model otherwise yields float16).
+    """
+    return model.encode(
+        text,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    ).astype(np.float32, copy=False)
 
-def embed_text(text: str) -> List[float]:
+
+def embed_many(chunks: List[str]) -> np.ndarray:
     """
-    Create embeddings for text using SentenceTransformer.
+    Embed chunks, reusing cached vectors and only encoding cache misses.
     """
-    return model.encode(text).tolist()
+    keys = [
+        hashlib.blake2b(f"{EMBED_MODEL}\0{c}".encode(), digest_size=16).hexdigest()
+        for c in chunks
+    ]
+    cached = [embed_cache.get(k) for k in keys]
+
+    misses = [i for i, vec in enumerate(cached) if vec is None]
+    if misses:
+        fresh = embed_text([chunks[i] for i in misses])
+        for i, vec in zip(misses, fresh):
+            embed_cache.set(keys[i], vec)
+            cached[i] = vec
+
+    if not cached:
+        return np.zeros((0, EMBED_DIM), dtype=np.float32)
+    return np.vstack(cached).astype(np.float32, copy=False)
 
 
 def embed_and_store_chunks(text: str, doc_id: str, chunk_size: int = 500) -> int:
@@ -49,35 +91,44 @@ def embed_and_store_chunks(text: str, doc_id: str, chunk_size: int = 500) -> int
     Split text into chunks, embed them, and store in Pinecone.
     Returns number of chunks processed.
     """
-    chunks = chunk_text(text, chunk_size)
+    # Skip very small chunks, keeping original positions for refs
+    indexed = [
+        (i, chunk) for i, chunk in enumerate(chunk_text(text, chunk_size))
+        if len(chunk.strip()) >= 20
+    ]
+    if not indexed:
+        return 0
+
+    # Collapse repeated chunks (e.g. per-page headers/footers), remembering every position
+    positions: Dict[str, List[int]] = {}
+    for i, chunk in indexed:
+        positions.setdefault(chunk, []).append(i)
+    unique = [(occ[0], chunk) for chunk, occ in positions.items()]
+
+    # Create all embeddings in one batched call, skipping cached chunks
+    embeddings = embed_many([chunk for _, chunk in unique])
 
     vectors = []
-    for i, chunk in enumerate(chunks):
-        if len(chunk.strip()) < 20:  # Skip very small chunks
-            continue
-
-        # Create embedding
-        embedding = embed_text(chunk)
-
-        # Create metadata
+    for (i, chunk), embedding in zip(unique, embeddings):
+        # Create metadata; "refs" lists every occurrence so citations cover all of them
         metadata = {
             "doc_id": doc_id,
             "ref": f"chunk-{i + 1}",
+            "refs": [f"chunk-{j + 1}" for j in positions[chunk]],
             "text": chunk
         }
 
         # Create vector ID
         vector_id = f"{doc_id}_chunk_{i + 1}"
 
-        vectors.append((vector_id, embedding, metadata))
-
-        # Batch upsert to Pinecone
-        if len(vectors) >= 100:
-            index.upsert(vectors=vectors)
-            vectors = []
+        vectors.append((vector_id, embedding.tolist(), metadata))
 
-    # Upsert any remaining vectors
-    if vectors:
-        index.upsert(vectors=vectors)
+    # Issue all 100-vector batches concurrently, then wait for them
+    futures = [
+        index.upsert(vectors=vectors[i:i + 100], async_req=True)
+        for i in range(0, len(vectors), 100)
+    ]
+    for future in futures:
+        future.get()
 
-    return len(chunks)
\ No newline at end of file
+    return len(indexed)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+# Cache settings
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 1024))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", 3600))
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache with TTL for text embeddings.
+    """
+
+    def __init__(self, capacity: int = EMBED_CACHE_SIZE, ttl: float = EMBED_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data: "OrderedDict[bytes, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model: str, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(model.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text[:1024].encode("utf-8"))
+        return h.digest()
+
+    def get(self, model: str, text: str):
+        """
+        Return the cached vector, or None if missing or expired.
+        """
+        key = self._key(model, text)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            ts, vec = entry
+            if time.monotonic() - ts > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return vec
+
+    def set(self, model: str, text: str, vec: List[float]) -> None:
+        key = self._key(model, text)
+        with self._lock:
+            self._data[key] = (time.monotonic(), vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, text: str, compute_fn: Callable[[str], List[float]], model: str = "") -> List[float]:
+        """
+        Return the cached vector for text, computing and storing it on a miss.
+        """
+        vec = self.get(model, text)
+        if vec is None:
+            vec = compute_fn(text)
+            self.set(model, text, vec)
+        return vec
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Shared process-wide cache
+embedding_cache = EmbeddingCache()
@@ -1,5 +1,9 @@
 import os
+import threading
+import multiprocessing
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from PyPDF2 import PdfReader
 import pytesseract
 from PIL import Image
@@ -14,20 +18,148 @@ try:
 except ImportError:
     HAS_PDF2IMAGE = False
 
+# PyMuPDF is preferred for PDF text and rasterization when installed
+try:
+    import fitz
+
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+# tesserocr binds libtesseract directly; pytesseract (one subprocess per call) is the fallback
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+
+    HAS_TESSEROCR = True
+except ImportError:
+    HAS_TESSEROCR = False
+
+# Worker processes for page-parallel extraction and OCR
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", os.cpu_count() or 1))
+# PDFs with at least this many pages have their text layer extracted in parallel
+PARALLEL_PAGE_THRESHOLD = 20
+
+# Image OCR preprocessing: longest side cap, binarization cutoff and Tesseract flags.
+# PDF pages keep Tesseract's automatic page segmentation (multi-column layouts);
+# standalone images are read as a single text block
+OCR_MAX_SIDE = 2000
+OCR_THRESHOLD = 180
+OCR_CONFIG = "--oem 1"
+OCR_IMAGE_CONFIG = "--oem 1 --psm 6"
+_BINARIZE_LUT = [255 if p > OCR_THRESHOLD else 0 for p in range(256)]
+
+# One tesserocr API per thread (and so per worker process), reused across images
+_tess = threading.local()
+
+# Shared worker process pool, created on first use. Workers are spawned rather than
+# forked so they don't copy the (multi-threaded, model-holding) server process
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _pool_map(fn, items) -> list:
+    """
+    Map fn over items in the shared worker pool. If a worker died (e.g. OOM-killed)
+    and broke the pool, replace the pool and retry once.
+    """
+    global _executor
+    items = list(items)
+    executor = _get_executor()
+    try:
+        return list(executor.map(fn, items))
+    except BrokenProcessPool:
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        executor.shutdown(wait=False)
+        return list(_get_executor().map(fn, items))
+
+
+def _ocr(img: Image.Image, single_block: bool = False) -> str:
+    """
+    OCR a single image, reusing a per-thread tesserocr API when available.
+    """
+    if not HAS_TESSEROCR:
+        return pytesseract.image_to_string(img, config=OCR_IMAGE_CONFIG if single_block else OCR_CONFIG)
+
+    api = getattr(_tess, "api", None)
+    if api is None:
+        api = _tess.api = PyTessBaseAPI(oem=OEM.LSTM_ONLY)
+    api.SetPageSegMode(PSM.SINGLE_BLOCK if single_block else PSM.AUTO)
+    api.SetImage(img)
+    return api.GetUTF8Text()
+
+
+def _extract_page_range(args) -> list:
+    """
+    Extract text for pages [start, stop) of a PDF. Runs in a worker process.
+    """
+    file_path, start, stop = args
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def _ocr_images(images) -> str:
+    """
+    OCR page images in parallel worker processes.
+    """
+    texts = _pool_map(_ocr, images)
+    return "".join(text + "\n\n" for text in texts)
+
+
+def _pdf_text_pypdf2(file_path: str) -> str:
+    """
+    Extract the PDF text layer with PyPDF2, split across processes for large PDFs.
+    """
+    reader = PdfReader(file_path)
+    num_pages = len(reader.pages)
+
+    if num_pages >= PARALLEL_PAGE_THRESHOLD and OCR_WORKERS > 1:
+        step = -(-num_pages // OCR_WORKERS)
+        ranges = [(file_path, start, min(start + step, num_pages)) for start in range(0, num_pages, step)]
+        page_texts = [text for part in _pool_map(_extract_page_range, ranges) for text in part]
+    else:
+        page_texts = [page.extract_text() for page in reader.pages]
+
+    return "".join(text + "\n\n" for text in page_texts if text)
+
 
 def ocr_pdf(file_path: str) -> str:
     """
-    Extract text from PDF using PyPDF2 and OCR if needed.
+    Extract text from PDF using PyMuPDF (or PyPDF2) and OCR if needed.
     """
     try:
-        pdf_text = ""
-        reader = PdfReader(file_path)
+        if HAS_PYMUPDF:
+            with fitz.open(file_path) as doc:
+                pdf_text = "".join(text + "\n\n" for text in (page.get_text() for page in doc) if text)
+
+                # If we got sufficient text, return it
+                if len(pdf_text.strip()) > 100:
+                    return pdf_text
+
+                # If text extraction failed, rasterize pages directly and OCR them
+                if not pdf_text.strip():
+                    images = []
+                    for page in doc:
+                        pix = page.get_pixmap(dpi=200)
+                        images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+                    return _ocr_images(images)
+
+                return pdf_text
 
         # First try PyPDF2 text extraction
-        for page in reader.pages:
-            text = page.extract_text()
-            if text:
-                pdf_text += text + "\n\n"
+        pdf_text = _pdf_text_pypdf2(file_path)
 
         # If we got sufficient text, return it
         if len(pdf_text.strip()) > 100:
@@ -35,11 +167,7 @@ def ocr_pdf(file_path: str) -> str:
 
         # If text extraction failed, try OCR if pdf2image is available
         if HAS_PDF2IMAGE and not pdf_text.strip():
-            ocr_text = ""
-            images = convert_from_path(file_path)
-            for img in images:
-                ocr_text += pytesseract.image_to_string(img) + "\n\n"
-            return ocr_text
+            return _ocr_images(convert_from_path(file_path))
 
         return pdf_text
 
@@ -48,13 +176,26 @@ def ocr_pdf(file_path: str) -> str:
         return ""
 
 
+def _preprocess_image(img: Image.Image) -> Image.Image:
+    """
+    Grayscale, downscale to OCR_MAX_SIDE and binarize an image for Tesseract.
+    """
+    img = img.convert("L")
+    w, h = img.size
+    scale = min(1.0, OCR_MAX_SIDE / max(w, h))
+    if scale < 1.0:
+        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    return img.point(_BINARIZE_LUT)
+
+
 def ocr_image(file_path: str) -> str:
     """
     Extract text from images using OCR.
     """
     try:
-        img = Image.open(file_path)
-        text = pytesseract.image_to_string(img)
+        with Image.open(file_path) as img:
+            img = _preprocess_image(img)
+        text = _ocr(img, single_block=True)
         return text
     except Exception as e:
         print(f"Error extracting text from image: {str(e)}")
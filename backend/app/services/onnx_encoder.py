@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import List, Union
+import numpy as np
+
+# onnxruntime is optional; SentenceTransformer is used when it is missing
+try:
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    HAS_ONNXRUNTIME = True
+except ImportError:
+    HAS_ONNXRUNTIME = False
+
+
+class OnnxEncoder:
+    """
+    Sentence embedder backed by an ONNX Runtime session.
+
+    Expects a directory produced by
+    `optimum-cli export onnx --model sentence-transformers/all-mpnet-base-v2 <dir>`
+    containing model.onnx and the tokenizer files. Output matches
+    SentenceTransformer's mean pooling + L2 normalization.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 384):
+        model_dir = Path(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider")
+                     if p in ort.get_available_providers()]
+        self.session = ort.InferenceSession(str(model_dir / "model.onnx"), options, providers=providers)
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_length = max_length
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self._dim = self.session.get_outputs()[0].shape[-1]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True,
+                                max_length=self.max_length, return_tensors="np")
+        feed = {k: v for k, v in inputs.items() if k in self._input_names}
+        token_embeddings = self.session.run(None, feed)[0]
+
+        # Mean pooling over non-padding tokens, then L2 normalize
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Encode one text or a list of texts. Extra SentenceTransformer kwargs are ignored.
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        if not texts:
+            return np.zeros((0, self._dim), dtype=np.float32)
+
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        vectors = np.vstack(batches).astype(np.float32, copy=False)
+        return vectors[0] if single else vectors
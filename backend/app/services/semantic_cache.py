@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import Any, List, Optional, Tuple
+import numpy as np
+
+# faiss is optional; without it the semantic cache is a no-op
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+
+# Cache settings
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_QUERY_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_QUERY_THRESHOLD", 0.85))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 2048))
+
+
+# Neighbours checked per lookup, since the nearest one may belong to another scope
+SEMANTIC_CACHE_CANDIDATES = 8
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of LLM results keyed by excerpt embeddings.
+
+    Each excerpt is embedded on its own (so it fits the model's input window)
+    and their normalized mean goes into a FAISS inner-product index. A lookup
+    hits when a stored entry has exactly the same `scope` (e.g. document IDs
+    and LLM settings), an excerpt cosine similarity of at least `threshold`
+    and a query cosine similarity of at least `query_threshold` (or neither
+    has a query). When full, the oldest half of the entries is evicted.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, capacity: int = SEMANTIC_CACHE_SIZE,
+                 query_threshold: float = SEMANTIC_CACHE_QUERY_THRESHOLD):
+        self.threshold = threshold
+        self.query_threshold = query_threshold
+        self.capacity = capacity
+        self.enabled = HAS_FAISS
+        self._model = None
+        self._index = None
+        self._vectors: List[np.ndarray] = []
+        self._values: List[Any] = []
+        self._scopes: List[str] = []
+        self._queries: List[Optional[np.ndarray]] = []
+        self._lock = threading.Lock()
+
+    def _embed(self, texts: List[str], query: Optional[str]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Embed texts and query in one call; return the normalized mean text vector
+        (shaped for FAISS) and the query vector, or None without a query.
+        """
+        with self._lock:
+            if self._model is None:
+                self._model = SentenceTransformer(SEMANTIC_CACHE_MODEL, device="cpu")
+        inputs = texts + [query] if query else texts
+        vecs = np.asarray(self._model.encode(inputs, normalize_embeddings=True, show_progress_bar=False),
+                          dtype=np.float32)
+        query_vec = vecs[-1] if query else None
+        vec = vecs[:len(texts)].mean(axis=0)
+        return (vec / max(float(np.linalg.norm(vec)), 1e-12))[None, :], query_vec
+
+    def _query_matches(self, stored: Optional[np.ndarray], query_vec: Optional[np.ndarray]) -> bool:
+        if stored is None or query_vec is None:
+            return stored is None and query_vec is None
+        return float(stored @ query_vec) >= self.query_threshold
+
+    def get(self, texts: List[str], scope: str, query: Optional[str] = None) -> Optional[Any]:
+        """
+        Return the value cached for the most similar texts and query within the
+        same scope, or None below the thresholds.
+        """
+        if not self.enabled or not texts:
+            return None
+        vec, query_vec = self._embed(texts, query)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(vec, min(SEMANTIC_CACHE_CANDIDATES, self._index.ntotal))
+            for score, i in zip(scores[0], ids[0]):
+                if score < self.threshold:
+                    break
+                if i >= 0 and self._scopes[i] == scope and self._query_matches(self._queries[i], query_vec):
+                    return self._values[i]
+        return None
+
+    def set(self, texts: List[str], scope: str, value: Any, query: Optional[str] = None) -> None:
+        if not self.enabled or not texts:
+            return
+        vec, query_vec = self._embed(texts, query)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexFlatIP(vec.shape[1])
+            if len(self._values) >= self.capacity:
+                keep = self.capacity // 2
+                self._vectors = self._vectors[-keep:]
+                self._values = self._values[-keep:]
+                self._scopes = self._scopes[-keep:]
+                self._queries = self._queries[-keep:]
+                self._index.reset()
+                if self._vectors:
+                    self._index.add(np.vstack(self._vectors))
+            self._index.add(vec)
+            self._vectors.append(vec[0])
+            self._values.append(value)
+            self._scopes.append(scope)
+            self._queries.append(query_vec)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vectors.clear()
+            self._values.clear()
+            self._scopes.clear()
+            self._queries.clear()
+            if self._index is not None:
+                self._index.reset()
+
+
+# Shared process-wide cache
+semantic_cache = SemanticCache()
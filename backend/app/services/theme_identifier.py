@@ -1,140 +1,773 @@
 import os
-import json
-from typing import List, Dict, Any, Optional
+import re
+import math
+import asyncio
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from itertools import cycle, islice
+from typing import List, Dict, Any, Iterable, Optional, AsyncIterator, Tuple
 import openai
+import diskcache
+import anyio
+import aiohttp
 import requests
+import orjson
+from requests.adapters import HTTPAdapter
+from tenacity import Retrying, AsyncRetrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception
 from dotenv import load_dotenv
+from backend.app.core.http_client import get_llm_session
+from backend.app.core.api_keys import load_keys
+from backend.app.services.semantic_cache import semantic_cache
+
+# datasketch enables near-duplicate detection; exact matching is the fallback
+try:
+    from datasketch import MinHash, MinHashLSH
+
+    HAS_DATASKETCH = True
+except ImportError:
+    HAS_DATASKETCH = False
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Setup API keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+# Max in-flight async calls per API key (defaults to the per-provider limit)
+LLM_KEY_CONCURRENCY = int(os.getenv("LLM_KEY_CONCURRENCY", os.getenv("LLM_CONCURRENCY", 8)))
+
+
+class _KeyPool:
+    """
+    Round-robin pool of API keys, each with its own async concurrency limit.
+    """
+
+    def __init__(self, keys: List[str]):
+        self.keys = keys
+        self._cycle = cycle(keys)
+        self._lock = threading.Lock()
+        self._semaphores = {key: asyncio.Semaphore(LLM_KEY_CONCURRENCY) for key in keys}
+
+    def next(self) -> str:
+        with self._lock:
+            return next(self._cycle)
+
+    def semaphore(self, key: str) -> asyncio.Semaphore:
+        return self._semaphores[key]
+
+
+_OPENAI_KEYS = _KeyPool(load_keys("OPENAI_API_KEYS", OPENAI_API_KEY))
+_GROQ_KEYS = _KeyPool(load_keys("GROQ_API_KEYS", GROQ_API_KEY))
+
+_DEFAULT_MODELS = {"openai": "gpt-4-turbo", "groq": "llama3-8b-8192"}
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+# Async Groq calls: connect and per-read limits, so long streams aren't cut off
+GROQ_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=60)
+
+# Keep-alive connection pool for sync Groq calls
+_GROQ_SESSION = requests.Session()
+_GROQ_SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=0))
+
+# OpenAI Batch API: used for bulk runs of at least BATCH_MIN_INPUTS documents
+OPENAI_API_BASE = "https://api.openai.com/v1"
+BATCH_MIN_INPUTS = int(os.getenv("BATCH_MIN_INPUTS", 8))
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", 30))
+# Longest a caller waits for a batch before cancelling it (the completion window is 24h)
+BATCH_MAX_WAIT = float(os.getenv("BATCH_MAX_WAIT", 6 * 3600))
+_OPENAI_SESSION = requests.Session()
+
+# Excerpt selection: candidates read, Jaccard cutoff for near-duplicates, excerpts kept
+MAX_CANDIDATE_CHUNKS = 20
+DEDUPE_THRESHOLD = float(os.getenv("THEME_DEDUPE_THRESHOLD", 0.85))
+THEME_TOP_K = int(os.getenv("THEME_TOP_K", 12))
+
+# Sampling settings shared by every provider call
+LLM_TEMPERATURE = 0.3
+# Output cap sized to the "2-3 themes" JSON: a short summary and a few doc IDs per theme
+MAX_THEMES = 3
+TOKENS_PER_THEME = 120
+LLM_MAX_TOKENS = MAX_THEMES * TOKENS_PER_THEME
+# Provider-native JSON mode, so responses are always a parseable JSON object
+LLM_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Status codes worth retrying: rate limits and transient server errors
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
 
-if LLM_PROVIDER == "openai" and not OPENAI_API_KEY:
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry rate limits, 5xx and connection failures; fail fast on other errors (e.g. auth)."""
+    if isinstance(exc, (openai.error.RateLimitError, openai.error.APIConnectionError,
+                        openai.error.ServiceUnavailableError, openai.error.Timeout)):
+        return True
+    if isinstance(exc, openai.error.APIError):
+        return exc.http_status in _RETRYABLE_STATUS
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and exc.response.status_code in _RETRYABLE_STATUS
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in _RETRYABLE_STATUS
+    return False
+
+
+# Exponential backoff with jitter for provider calls
+_RETRY_POLICY = dict(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential_jitter(initial=1.0, max=30, jitter=0.5),
+    retry=retry_if_exception(_is_retryable),
+    reraise=True
+)
+
+# Failures of an LLM call that become an error result instead of propagating
+_LLM_ERRORS = (
+    openai.error.OpenAIError,
+    requests.exceptions.RequestException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    RuntimeError
+)
+
+# Persistent exact-match cache of LLM responses
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 86400))
+llm_cache = diskcache.Cache(os.getenv("LLM_CACHE_DIR", ".llm_cache"))
+
+# Max in-flight async LLM calls per provider, to stay under rate limits; scales with the key pool
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+_LLM_SEMAPHORES = {
+    provider: asyncio.Semaphore(LLM_CONCURRENCY * max(1, len(pool.keys)))
+    for provider, pool in (("openai", _OPENAI_KEYS), ("groq", _GROQ_KEYS))
+}
+# Futures of async LLM calls in progress, keyed like the response cache
+_inflight: Dict[str, asyncio.Future] = {}
+
+if LLM_PROVIDER == "openai" and not _OPENAI_KEYS.keys:
     raise RuntimeError("Missing OPENAI_API_KEY")
-if LLM_PROVIDER == "groq" and not GROQ_API_KEY:
+if LLM_PROVIDER == "groq" and not _GROQ_KEYS.keys:
     raise RuntimeError("Missing GROQ_API_KEY")
 
-# Initialize OpenAI if needed
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+
+def _messages(prompt: str, system: Optional[str] = None) -> List[Dict[str, str]]:
+    """Chat messages with the fixed instructions first, so providers can reuse the cached prefix."""
+    if system:
+        return [{"role": "system", "content": system}, {"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}]
 
 
-def call_openai_llm(prompt: str, model: str = "gpt-4-turbo") -> str:
+def call_openai_llm(prompt: str, model: str = "gpt-4-turbo", system: Optional[str] = None,
+                    max_tokens: int = LLM_MAX_TOKENS) -> str:
     """Call OpenAI LLM API."""
-    try:
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
-        raise RuntimeError(f"OpenAI call failed: {str(e)}")
+    for attempt in Retrying(**_RETRY_POLICY):
+        with attempt:
+            response = openai.ChatCompletion.create(
+                api_key=_OPENAI_KEYS.next(),
+                model=model,
+                messages=_messages(prompt, system),
+                temperature=LLM_TEMPERATURE,
+                max_tokens=max_tokens,
+                response_format=LLM_RESPONSE_FORMAT
+            )
+    return response.choices[0].message.content.strip()
 
 
-def call_groq_llm(prompt: str, model: str = "llama3-8b-8192") -> str:
+def call_groq_llm(prompt: str, model: str = "llama3-8b-8192", system: Optional[str] = None,
+                  max_tokens: int = LLM_MAX_TOKENS) -> str:
     """Call Groq LLM API."""
-    try:
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        body = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.3,
-            "max_tokens": 1000
-        }
-        response = requests.post("https://api.groq.com/openai/v1/chat/completions",
-                                 headers=headers, json=body)
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"].strip()
-    except Exception as e:
-        print(f"Groq API error: {e}")
-        raise RuntimeError(f"Groq call failed: {str(e)}")
+    body = {
+        "model": model,
+        "messages": _messages(prompt, system),
+        "temperature": LLM_TEMPERATURE,
+        "max_tokens": max_tokens,
+        "response_format": LLM_RESPONSE_FORMAT
+    }
+    for attempt in Retrying(**_RETRY_POLICY):
+        with attempt:
+            headers = {
+                "Authorization": f"Bearer {_GROQ_KEYS.next()}",
+                "Content-Type": "application/json"
+            }
+            response = _GROQ_SESSION.post(GROQ_CHAT_URL, headers=headers, json=body, timeout=(5, 60))
+            response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"].strip()
+
+
+def _cache_key(provider: str, model: str, prompt: str, system: Optional[str] = None,
+               max_tokens: int = LLM_MAX_TOKENS) -> str:
+    """Key a response by everything that shapes it, so setting changes miss the cache."""
+    raw = f"{provider}|{model}|{LLM_TEMPERATURE}|{max_tokens}|{LLM_RESPONSE_FORMAT['type']}|{system or ''}|{prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_response(key: str, content: str) -> None:
+    """Cache a response only if it parses, so output cut off at max_tokens isn't replayed."""
+    if content and "error" not in _parse_themes(content):
+        llm_cache.set(key, content, expire=LLM_CACHE_TTL)
 
 
-def call_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None) -> str:
-    """Unified LLM calling function."""
+def call_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None,
+             system: Optional[str] = None, max_tokens: int = LLM_MAX_TOKENS) -> str:
+    """Unified LLM calling function, served from the response cache when possible."""
     provider = provider or LLM_PROVIDER
-    model = model or {"openai": "gpt-4-turbo", "groq": "llama3-8b-8192"}.get(provider)
+    if provider not in _DEFAULT_MODELS:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+    model = model or _DEFAULT_MODELS[provider]
+
+    key = _cache_key(provider, model, prompt, system, max_tokens)
+    content = llm_cache.get(key)
+    if content is not None:
+        return content
 
     if provider == "openai":
-        return call_openai_llm(prompt, model)
-    elif provider == "groq":
-        return call_groq_llm(prompt, model)
+        content = call_openai_llm(prompt, model, system, max_tokens)
     else:
+        content = call_groq_llm(prompt, model, system, max_tokens)
+    _cache_response(key, content)
+    return content
+
+
+async def acall_openai_llm(prompt: str, model: str = "gpt-4-turbo", system: Optional[str] = None,
+                           max_tokens: int = LLM_MAX_TOKENS) -> str:
+    """Call OpenAI LLM API without blocking the event loop."""
+    # Route acreate through the shared pooled aiohttp session
+    openai.aiosession.set(get_llm_session())
+    # Concurrency slots are held per attempt, so retry backoff doesn't block other callers
+    async for attempt in AsyncRetrying(**_RETRY_POLICY):
+        with attempt:
+            api_key = _OPENAI_KEYS.next()
+            async with _LLM_SEMAPHORES["openai"], _OPENAI_KEYS.semaphore(api_key):
+                response = await openai.ChatCompletion.acreate(
+                    api_key=api_key,
+                    model=model,
+                    messages=_messages(prompt, system),
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=max_tokens,
+                    response_format=LLM_RESPONSE_FORMAT
+                )
+    return response.choices[0].message.content.strip()
+
+
+async def acall_groq_llm(prompt: str, model: str = "llama3-8b-8192", system: Optional[str] = None,
+                         max_tokens: int = LLM_MAX_TOKENS) -> str:
+    """Call Groq LLM API over the shared aiohttp session, (de)serializing with orjson."""
+    body = orjson.dumps({
+        "model": model,
+        "messages": _messages(prompt, system),
+        "temperature": LLM_TEMPERATURE,
+        "max_tokens": max_tokens,
+        "response_format": LLM_RESPONSE_FORMAT
+    })
+    # Concurrency slots are held per attempt, so retry backoff doesn't block other callers
+    async for attempt in AsyncRetrying(**_RETRY_POLICY):
+        with attempt:
+            api_key = _GROQ_KEYS.next()
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+            async with _LLM_SEMAPHORES["groq"], _GROQ_KEYS.semaphore(api_key):
+                async with get_llm_session().post(GROQ_CHAT_URL, headers=headers, data=body,
+                                                  timeout=GROQ_TIMEOUT) as response:
+                    response.raise_for_status()
+                    data = orjson.loads(await response.read())
+    return data["choices"][0]["message"]["content"].strip()
+
+
+async def acall_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None,
+                    system: Optional[str] = None, max_tokens: int = LLM_MAX_TOKENS) -> str:
+    """
+    Unified async LLM calling function, cached and bounded per provider.
+    Identical concurrent calls share a single in-flight provider request.
+    """
+    provider = provider or LLM_PROVIDER
+    if provider not in _DEFAULT_MODELS:
         raise ValueError(f"Unsupported LLM provider: {provider}")
+    model = model or _DEFAULT_MODELS[provider]
+
+    key = _cache_key(provider, model, prompt, system, max_tokens)
+    content = llm_cache.get(key)
+    if content is not None:
+        return content
+
+    # Follow an identical call that is already in progress
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await asyncio.shield(pending)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        if provider == "openai":
+            content = await acall_openai_llm(prompt, model, system, max_tokens)
+        else:
+            content = await acall_groq_llm(prompt, model, system, max_tokens)
+        _cache_response(key, content)
+        fut.set_result(content)
+        return content
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # Mark retrieved so an unfollowed failure isn't logged twice
+        raise
+    finally:
+        del _inflight[key]
+
+
+async def astream_llm(prompt: str, provider: Optional[str] = None, model: Optional[str] = None,
+                      system: Optional[str] = None, max_tokens: int = LLM_MAX_TOKENS) -> AsyncIterator[str]:
+    """
+    Stream response text deltas as the provider generates them.
+    The full response is written to the response cache once complete, if it parses.
+    """
+    provider = provider or LLM_PROVIDER
+    if provider not in _DEFAULT_MODELS:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+    model = model or _DEFAULT_MODELS[provider]
+
+    key = _cache_key(provider, model, prompt, system, max_tokens)
+    content = llm_cache.get(key)
+    if content is not None:
+        yield content
+        return
+
+    parts = []
+    async with _LLM_SEMAPHORES[provider]:
+        if provider == "openai":
+            openai.aiosession.set(get_llm_session())
+            api_key = _OPENAI_KEYS.next()
+            async with _OPENAI_KEYS.semaphore(api_key):
+                stream = await openai.ChatCompletion.acreate(
+                    api_key=api_key,
+                    model=model,
+                    messages=_messages(prompt, system),
+                    temperature=LLM_TEMPERATURE,
+                    max_tokens=max_tokens,
+                    response_format=LLM_RESPONSE_FORMAT,
+                    stream=True
+                )
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        else:
+            api_key = _GROQ_KEYS.next()
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            }
+            body = orjson.dumps({
+                "model": model,
+                "messages": _messages(prompt, system),
+                "temperature": LLM_TEMPERATURE,
+                "max_tokens": max_tokens,
+                "response_format": LLM_RESPONSE_FORMAT,
+                "stream": True
+            })
+            async with _GROQ_KEYS.semaphore(api_key):
+                async with get_llm_session().post(GROQ_CHAT_URL, headers=headers, data=body,
+                                                  timeout=GROQ_TIMEOUT) as response:
+                    response.raise_for_status()
+                    # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+                    async for raw in response.content:
+                        line = raw.decode("utf-8").strip()
+                        if not line.startswith("data: ") or line == "data: [DONE]":
+                            continue
+                        choices = orjson.loads(line[6:]).get("choices") or [{}]
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+
+    _cache_response(key, "".join(parts).strip())
+
+
+class _ThemeStreamParser:
+    """
+    Incrementally scan a streamed JSON object and emit each top-level
+    member as soon as it is complete.
+    """
+
+    def __init__(self):
+        self._buf = []
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        members = []
+        self._buf.append(text)
+        buf = "".join(self._buf)
+        self._buf = [buf]
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                if self._depth == 1 and self._member_start is None:
+                    self._member_start = i
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    members.extend(self._emit(buf, i))
+            elif ch == "," and self._depth == 1:
+                members.extend(self._emit(buf, i))
+        self._pos = len(buf)
+        return members
+
+    def _emit(self, buf: str, end: int) -> List[Tuple[str, Any]]:
+        start, self._member_start = self._member_start, None
+        if start is None:
+            return []
+        try:
+            return list(orjson.loads("{" + buf[start:end] + "}").items())
+        except orjson.JSONDecodeError:
+            return []
+
+
+_WORD_RE = re.compile(r"\w+")
+
 
+def _dedupe_pairs(pairs: List[tuple]) -> List[tuple]:
+    """Keep one (chunk, doc_id) pair per cluster of near-identical chunks."""
+    if not HAS_DATASKETCH:
+        seen = set()
+        unique = []
+        for chunk, doc_id in pairs:
+            norm = " ".join(_WORD_RE.findall(chunk.lower()))
+            if norm not in seen:
+                seen.add(norm)
+                unique.append((chunk, doc_id))
+        return unique
 
-def identify_themes(chunks: List[str], doc_ids: List[str], query: Optional[str] = None) -> Dict[str, Any]:
+    lsh = MinHashLSH(threshold=DEDUPE_THRESHOLD, num_perm=64)
+    unique = []
+    for i, (chunk, doc_id) in enumerate(pairs):
+        words = _WORD_RE.findall(chunk.lower())
+        shingles = {" ".join(words[j:j + 3]) for j in range(max(1, len(words) - 2))}
+        mh = MinHash(num_perm=64)
+        for sh in shingles:
+            mh.update(sh.encode("utf-8"))
+        if lsh.query(mh):
+            continue
+        lsh.insert(str(i), mh)
+        unique.append((chunk, doc_id))
+    return unique
+
+
+def _term_cosine(a: Counter, b: Counter) -> float:
+    dot = sum(count * b[term] for term, count in a.items())
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def _select_chunks(pairs: List[tuple], query: Optional[str] = None, top_k: int = THEME_TOP_K) -> List[tuple]:
+    """
+    Drop near-duplicate chunks, then keep the top_k most query-relevant ones
+    (by term-frequency cosine), or the first top_k when there is no query.
+    """
+    pairs = _dedupe_pairs(pairs)
+    if not query or len(pairs) <= top_k:
+        return pairs[:top_k]
+
+    query_terms = Counter(_WORD_RE.findall(query.lower()))
+    scores = [_term_cosine(query_terms, Counter(_WORD_RE.findall(chunk.lower()))) for chunk, _ in pairs]
+    ranked = sorted(range(len(pairs)), key=lambda i: scores[i], reverse=True)
+    return [pairs[i] for i in ranked[:top_k]]
+
+
+# Fixed theme-extraction instructions, sent as the system message so the prefix is identical across calls
+HEADER_PROMPT = (
+    "You are an AI assistant specializing in document research. "
+    "Identify 2-3 major themes from the excerpts the user provides.\n"
+)
+
+FOOTER_PROMPT = (
+    "Extract 2-3 key themes.\n"
+    "Each theme should include:\n"
+    "- A short title\n"
+    "- A 2-3 sentence summary\n"
+    "- A list of supporting document IDs\n"
+    "Return response in this JSON format:\n"
+    "{\n"
+    "  \"Theme 1\": {\"summary\": \"...\", \"docs\": [\"DOC001\", \"DOC002\"]},\n"
+    "  \"Theme 2\": {\"summary\": \"...\", \"docs\": [\"DOC003\"]}\n"
+    "}\n"
+    "Respond with the JSON object only."
+)
+
+SYSTEM_PROMPT = HEADER_PROMPT + FOOTER_PROMPT
+
+
+EXCERPTS_HEADER = "Excerpts:\n"
+
+
+def _build_prompt(pairs: List[tuple], query: Optional[str] = None) -> str:
+    """Build the per-call user message (query and excerpts) from (chunk, doc_id) pairs."""
+    excerpts = "".join(
+        f"Excerpt {i + 1} (Doc: {doc_id}): {chunk.strip()}\n\n"
+        for i, (chunk, doc_id) in enumerate(pairs)
+    )
+    query_line = f"User Query: {query}\n\n" if query else ""
+    return query_line + EXCERPTS_HEADER + excerpts
+
+
+def _semantic_scope(pairs: List[tuple], max_tokens: int) -> str:
+    """
+    Exact part of a semantic cache key: the documents cited and the LLM settings.
+    Excerpts and query are compared by embedding similarity instead.
+    """
+    doc_ids = sorted({str(doc_id) for _, doc_id in pairs})
+    return _cache_key(LLM_PROVIDER, _DEFAULT_MODELS[LLM_PROVIDER], "\0".join(doc_ids), SYSTEM_PROMPT, max_tokens)
+
+
+def _cached_response(prompt: str, max_tokens: int) -> Optional[str]:
+    """Exact response cache lookup for the default provider and model."""
+    return llm_cache.get(_cache_key(LLM_PROVIDER, _DEFAULT_MODELS[LLM_PROVIDER], prompt, SYSTEM_PROMPT, max_tokens))
+
+
+def _parse_themes(content: str) -> Dict[str, Any]:
+    """Parse the JSON-mode LLM response into a themes dict."""
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        # Only possible when the response was cut off at max_tokens
+        return {"error": "Failed to parse LLM output", "raw_output": content}
+
+
+def identify_themes(chunks: Iterable[str], doc_ids: Iterable[str], query: Optional[str] = None,
+                    max_tokens: int = LLM_MAX_TOKENS) -> Dict[str, Any]:
     """
     Identify themes from document chunks using LLM.
 
     Args:
-        chunks: List of text chunks
-        doc_ids: List of document IDs corresponding to chunks
+        chunks: Text chunks (list or lazy iterable)
+        doc_ids: Document IDs corresponding to chunks
         query: Optional query to focus theme extraction
+        max_tokens: Cap on response tokens
 
     Returns:
         Dictionary of themes with summaries and associated document IDs
     """
-    if not chunks or len(chunks) == 0:
+    # Limit to reasonable number of chunks; only these are consumed
+    pairs = _select_chunks(list(islice(zip(chunks, doc_ids), MAX_CANDIDATE_CHUNKS)), query)
+    if not pairs:
         return {"error": "No document chunks provided for theme analysis"}
 
-    # Build the prompt
-    prompt = (
-        "You are an AI assistant specializing in document research. "
-        "Identify 2-3 major themes from the following excerpts.\n"
-    )
+    # Exact repeats come from the response cache without embedding anything
+    prompt = _build_prompt(pairs, query)
+    content = _cached_response(prompt, max_tokens)
+    if content is not None:
+        return _parse_themes(content)
 
-    if query:
-        prompt += f"User Query: {query}\n\n"
-
-    prompt += "Excerpts:\n"
-
-    # Limit to reasonable number of chunks
-    max_chunks = min(20, len(chunks))
-    for i in range(max_chunks):
-        prompt += f"Excerpt {i + 1} (Doc: {doc_ids[i]}): {chunks[i].strip()}\n\n"
-
-    prompt += (
-        "Extract 2-3 key themes.\n"
-        "Each theme should include:\n"
-        "- A short title\n"
-        "- A 2-3 sentence summary\n"
-        "- A list of supporting document IDs\n"
-        "Return response in this JSON format:\n"
-        "{\n"
-        "  \"Theme 1\": {\"summary\": \"...\", \"docs\": [\"DOC001\", \"DOC002\"]},\n"
-        "  \"Theme 2\": {\"summary\": \"...\", \"docs\": [\"DOC003\"]}\n"
-        "}"
-    )
+    # Serve near-identical excerpts and queries on the same documents from the semantic cache
+    texts = [chunk for chunk, _ in pairs]
+    scope = _semantic_scope(pairs, max_tokens)
+    cached = semantic_cache.get(texts, scope, query)
+    if cached is not None:
+        return cached
 
     # Call LLM
     try:
-        content = call_llm(prompt)
+        themes = _parse_themes(call_llm(prompt, system=SYSTEM_PROMPT, max_tokens=max_tokens))
+    except _LLM_ERRORS as e:
+        logger.exception("Theme identification failed")
+        return {"error": f"Theme identification failed: {str(e)}"}
 
-        # Try to parse the JSON response
+    if "error" not in themes:
+        semantic_cache.set(texts, scope, themes, query)
+    return themes
+
+
+async def identify_themes_async(chunks: Iterable[str], doc_ids: Iterable[str], query: Optional[str] = None,
+                                max_tokens: int = LLM_MAX_TOKENS) -> Dict[str, Any]:
+    """
+    Async variant of identify_themes; concurrent calls run interleaved
+    on the event loop instead of each holding a worker thread.
+    """
+    pairs = _select_chunks(list(islice(zip(chunks, doc_ids), MAX_CANDIDATE_CHUNKS)), query)
+    if not pairs:
+        return {"error": "No document chunks provided for theme analysis"}
+
+    # Exact repeats come from the response cache without embedding anything
+    prompt = _build_prompt(pairs, query)
+    content = _cached_response(prompt, max_tokens)
+    if content is not None:
+        return _parse_themes(content)
+
+    # Excerpt embedding is CPU-bound, so the semantic cache runs in a worker thread
+    texts = [chunk for chunk, _ in pairs]
+    scope = _semantic_scope(pairs, max_tokens)
+    cached = await anyio.to_thread.run_sync(semantic_cache.get, texts, scope, query)
+    if cached is not None:
+        return cached
+
+    try:
+        themes = _parse_themes(await acall_llm(prompt, system=SYSTEM_PROMPT, max_tokens=max_tokens))
+    except _LLM_ERRORS as e:
+        logger.exception("Theme identification failed")
+        return {"error": f"Theme identification failed: {str(e)}"}
+
+    if "error" not in themes:
+        await anyio.to_thread.run_sync(semantic_cache.set, texts, scope, themes, query)
+    return themes
+
+
+
+async def identify_themes_stream(chunks: Iterable[str], doc_ids: Iterable[str], query: Optional[str] = None,
+                                 max_tokens: int = LLM_MAX_TOKENS) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Streaming variant of identify_themes_async: yields (theme_name, {summary, docs})
+    as soon as each theme's JSON object is complete, rather than after the
+    whole response has been generated. Raises ValueError when there are no chunks.
+    """
+    pairs = _select_chunks(list(islice(zip(chunks, doc_ids), MAX_CANDIDATE_CHUNKS)), query)
+    if not pairs:
+        raise ValueError("No document chunks provided for theme analysis")
+
+    parser = _ThemeStreamParser()
+    async for delta in astream_llm(_build_prompt(pairs, query), system=SYSTEM_PROMPT, max_tokens=max_tokens):
+        for theme in parser.feed(delta):
+            yield theme
+
+
+def _run_openai_batch(bodies: Dict[str, Dict[str, Any]], max_wait: float = BATCH_MAX_WAIT) -> Dict[str, str]:
+    """
+    Submit chat completion bodies (keyed by custom_id) as one OpenAI batch,
+    wait for it to finish and return the response content per custom_id.
+
+    Blocks (polling with time.sleep) for up to max_wait seconds, then cancels
+    the batch and raises RuntimeError. Must not be called from request handlers
+    or the event loop; run it from a script or background worker.
+    """
+    # The batch's files belong to the key's account, so one key is used throughout
+    headers = {"Authorization": f"Bearer {_OPENAI_KEYS.next()}"}
+    lines = "".join(
+        orjson.dumps({"custom_id": cid, "method": "POST", "url": "/v1/chat/completions", "body": body}).decode() + "\n"
+        for cid, body in bodies.items()
+    )
+
+    response = _OPENAI_SESSION.post(
+        f"{OPENAI_API_BASE}/files", headers=headers,
+        data={"purpose": "batch"}, files={"file": ("themes.jsonl", lines.encode("utf-8"))},
+        timeout=(5, 300)
+    )
+    response.raise_for_status()
+    input_file_id = response.json()["id"]
+
+    response = _OPENAI_SESSION.post(
+        f"{OPENAI_API_BASE}/batches", headers=headers,
+        json={"input_file_id": input_file_id, "endpoint": "/v1/chat/completions", "completion_window": "24h"},
+        timeout=(5, 60)
+    )
+    response.raise_for_status()
+    batch = response.json()
+
+    deadline = time.monotonic() + max_wait
+    while batch["status"] not in ("completed", "failed", "expired", "cancelled"):
+        if time.monotonic() >= deadline:
+            _OPENAI_SESSION.post(f"{OPENAI_API_BASE}/batches/{batch['id']}/cancel", headers=headers, timeout=(5, 60))
+            raise RuntimeError(f"OpenAI batch {batch['id']} did not finish within {max_wait:.0f}s")
+        time.sleep(BATCH_POLL_INTERVAL)
+        response = _OPENAI_SESSION.get(f"{OPENAI_API_BASE}/batches/{batch['id']}", headers=headers, timeout=(5, 60))
+        response.raise_for_status()
+        batch = response.json()
+
+    if batch["status"] != "completed" or not batch.get("output_file_id"):
+        raise RuntimeError(f"OpenAI batch {batch['id']} ended with status {batch['status']}")
+
+    response = _OPENAI_SESSION.get(
+        f"{OPENAI_API_BASE}/files/{batch['output_file_id']}/content", headers=headers, timeout=(5, 300)
+    )
+    response.raise_for_status()
+
+    contents = {}
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        result = orjson.loads(line)
+        body = (result.get("response") or {}).get("body") or {}
+        if body.get("choices"):
+            contents[result["custom_id"]] = body["choices"][0]["message"]["content"].strip()
+    return contents
+
+
+def identify_themes_batch(inputs: List[Dict[str, Any]], max_wait: float = BATCH_MAX_WAIT) -> Dict[str, Dict[str, Any]]:
+    """
+    Identify themes for many documents at once.
+
+    Args:
+        inputs: Dicts with "id", "chunks", "doc_ids" and an optional "query"
+        max_wait: Longest to wait for an OpenAI batch, in seconds
+
+    Returns:
+        Themes (or an error dict) per input id. Runs of BATCH_MIN_INPUTS or more
+        go through the OpenAI Batch API (half price, up to 24h turnaround);
+        smaller runs and other providers use the real-time path. Responses
+        already in the response cache are not resubmitted, and batch results
+        are written back to it. Blocking; not for use in request handlers.
+    """
+    if LLM_PROVIDER != "openai" or len(inputs) < BATCH_MIN_INPUTS:
+        return {
+            item["id"]: identify_themes(item["chunks"], item["doc_ids"], item.get("query"))
+            for item in inputs
+        }
+
+    results: Dict[str, Dict[str, Any]] = {}
+    bodies: Dict[str, Dict[str, Any]] = {}
+    keys: Dict[str, str] = {}
+    model = _DEFAULT_MODELS["openai"]
+    for item in inputs:
+        pairs = _select_chunks(list(islice(zip(item["chunks"], item["doc_ids"]), MAX_CANDIDATE_CHUNKS)), item.get("query"))
+        if not pairs:
+            results[item["id"]] = {"error": "No document chunks provided for theme analysis"}
+            continue
+        prompt = _build_prompt(pairs, item.get("query"))
+        key = _cache_key("openai", model, prompt, SYSTEM_PROMPT, LLM_MAX_TOKENS)
+        content = llm_cache.get(key)
+        if content is not None:
+            results[item["id"]] = _parse_themes(content)
+            continue
+        keys[item["id"]] = key
+        bodies[item["id"]] = {
+            "model": model,
+            "messages": _messages(prompt, SYSTEM_PROMPT),
+            "temperature": LLM_TEMPERATURE,
+            "max_tokens": LLM_MAX_TOKENS,
+            "response_format": LLM_RESPONSE_FORMAT
+        }
+
+    if bodies:
         try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            # Try extracting JSON from the response
-            try:
-                start = content.find('{')
-                end = content.rfind('}') + 1
-                if start >= 0 and end > start:
-                    return json.loads(content[start:end])
-                else:
-                    return {"error": "Failed to parse LLM output", "raw_output": content}
-            except:
-                return {"error": "Failed to parse LLM output", "raw_output": content}
+            contents = _run_openai_batch(bodies, max_wait)
+        except _LLM_ERRORS as e:
+            logger.exception("Theme batch failed")
+            return {**results, **{cid: {"error": f"Theme identification failed: {str(e)}"} for cid in bodies}}
 
-    except Exception as e:
-        return {"error": f"Theme identification failed: {str(e)}"}
\ No newline at end of file
+        for cid in bodies:
+            content = contents.get(cid)
+            if content is None:
+                results[cid] = {"error": "No batch result returned"}
+                continue
+            _cache_response(keys[cid], content)
+            results[cid] = _parse_themes(content)
+    return results
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+from backend.app.services.theme_identifier import identify_themes_async
+
+logger = logging.getLogger(__name__)
+
+# Pool settings
+THEME_WORKERS = int(os.getenv("THEME_WORKERS", 16))
+THEME_QUEUE_SIZE = int(os.getenv("THEME_QUEUE_SIZE", 256))
+
+
+@dataclass
+class IdentifyRequest:
+    chunks: Iterable[str]
+    doc_ids: Iterable[str]
+    query: Optional[str] = None
+    fut: asyncio.Future = field(default_factory=lambda: asyncio.get_running_loop().create_future())
+
+
+class ThemeWorkerPool:
+    """
+    Fixed set of worker tasks that run theme identification from a bounded queue.
+
+    At most `workers` requests are processed at once; once `queue_size`
+    requests are waiting, submit() blocks until a slot frees up, so bursts
+    apply backpressure instead of piling up pending coroutines.
+    """
+
+    def __init__(self, workers: int = THEME_WORKERS, queue_size: int = THEME_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """
+        Spawn the worker tasks on the running event loop.
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Fail requests still waiting in the queue
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not item.fut.done():
+                item.fut.set_exception(RuntimeError("Theme worker pool stopped"))
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                if item.fut.done():
+                    continue  # Caller gave up while queued
+                result = await identify_themes_async(item.chunks, item.doc_ids, item.query)
+                if not item.fut.done():
+                    item.fut.set_result(result)
+            except asyncio.CancelledError:
+                if not item.fut.done():
+                    item.fut.cancel()
+                raise
+            except Exception as e:
+                logger.exception("Theme worker failed")
+                if not item.fut.done():
+                    item.fut.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def submit(self, chunks: Iterable[str], doc_ids: Iterable[str], query: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue a theme identification request and wait for its result.
+        Runs inline when the pool has not been started.
+        """
+        if not self.running:
+            return await identify_themes_async(chunks, doc_ids, query)
+        item = IdentifyRequest(chunks, doc_ids, query)
+        await self._queue.put(item)
+        return await item.fut
+
+
+# Shared process-wide pool, started by the app lifespan
+theme_worker_pool = ThemeWorkerPool()
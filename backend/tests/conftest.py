@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings read at import time by the modules under test
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("LLM_PROVIDER", "openai")
+os.environ.setdefault("LLM_CACHE_DIR", tempfile.mkdtemp(prefix="llm_cache_"))
+
+# Make the `backend` package importable when pytest is run from any directory
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
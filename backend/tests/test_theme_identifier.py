@@ -0,0 +1,121 @@
+import asyncio
+import orjson
+import pytest
+from backend.app.services import theme_identifier
+from backend.app.services.theme_identifier import _ThemeStreamParser
+
+THEMES = {
+    "Climate {risk}, \"adaptation\"": {"summary": "Costs rise, then fall.\\ Mostly.", "docs": ["DOC001", "DOC002"]},
+    "Funding": {"summary": "Grants [and loans] {nested}", "docs": ["DOC003"]},
+    "Policy": {"summary": "", "docs": []}
+}
+RESPONSE = orjson.dumps(THEMES).decode()
+
+
+# ========== _ThemeStreamParser ==========
+
+def _feed_all(deltas):
+    parser = _ThemeStreamParser()
+    members = []
+    for delta in deltas:
+        members.extend(parser.feed(delta))
+    return members
+
+
+def test_parser_single_delta():
+    assert _feed_all([RESPONSE]) == list(THEMES.items())
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_parser_split_deltas(size):
+    deltas = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+    assert _feed_all(deltas) == list(THEMES.items())
+
+
+def test_parser_emits_each_theme_once_complete():
+    parser = _ThemeStreamParser()
+    end = RESPONSE.index(',"Funding"')
+    assert parser.feed(RESPONSE[:end]) == []
+    assert parser.feed(",") == [next(iter(THEMES.items()))]
+
+
+def test_parser_escaped_quotes_and_braces_in_strings():
+    text = r'{"A \"quoted\" {name}": {"summary": "ends with backslash \\", "docs": ["D,1"]}}'
+    assert _feed_all(list(text)) == list(orjson.loads(text).items())
+
+
+def test_parser_skips_malformed_member():
+    assert _feed_all(['{"Bad": {"summary": }, "Good": {"docs": []}}']) == [("Good", {"docs": []})]
+
+
+# ========== acall_llm single-flight ==========
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    """Replace the OpenAI call with a controllable fake and start from an empty cache."""
+    theme_identifier.llm_cache.clear()
+    state = {"calls": 0, "release": None, "result": RESPONSE, "error": None}
+
+    async def fake_acall_openai_llm(prompt, model, system=None, max_tokens=None):
+        state["calls"] += 1
+        await state["release"].wait()
+        if state["error"] is not None:
+            raise state["error"]
+        return state["result"]
+
+    monkeypatch.setattr(theme_identifier, "acall_openai_llm", fake_acall_openai_llm)
+    yield state
+    theme_identifier.llm_cache.clear()
+
+
+def test_identical_concurrent_calls_share_one_request(fake_provider):
+    async def run():
+        fake_provider["release"] = asyncio.Event()
+        tasks = [asyncio.create_task(theme_identifier.acall_llm("same prompt", provider="openai")) for _ in range(5)]
+        await asyncio.sleep(0)
+        fake_provider["release"].set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.run(run()) == [RESPONSE] * 5
+    assert fake_provider["calls"] == 1
+    assert theme_identifier._inflight == {}
+
+
+def test_completed_call_is_served_from_cache(fake_provider):
+    async def run():
+        fake_provider["release"] = asyncio.Event()
+        fake_provider["release"].set()
+        first = await theme_identifier.acall_llm("cached prompt", provider="openai")
+        second = await theme_identifier.acall_llm("cached prompt", provider="openai")
+        return first, second
+
+    assert asyncio.run(run()) == (RESPONSE, RESPONSE)
+    assert fake_provider["calls"] == 1
+
+
+def test_failure_is_shared_and_not_cached(fake_provider):
+    async def run():
+        fake_provider["release"] = asyncio.Event()
+        fake_provider["error"] = RuntimeError("provider down")
+        tasks = [asyncio.create_task(theme_identifier.acall_llm("failing prompt", provider="openai")) for _ in range(3)]
+        await asyncio.sleep(0)
+        fake_provider["release"].set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert fake_provider["calls"] == 1
+    assert theme_identifier._inflight == {}
+    assert len(theme_identifier.llm_cache) == 0
+
+
+def test_truncated_response_is_not_cached(fake_provider):
+    async def run():
+        fake_provider["release"] = asyncio.Event()
+        fake_provider["release"].set()
+        fake_provider["result"] = RESPONSE[:20]
+        await theme_identifier.acall_llm("truncated prompt", provider="openai")
+        await theme_identifier.acall_llm("truncated prompt", provider="openai")
+
+    asyncio.run(run())
+    assert fake_provider["calls"] == 2
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from backend.app.services import theme_worker_pool as pool_module
+from backend.app.services.theme_worker_pool import ThemeWorkerPool
+
+
+@pytest.fixture
+def fake_identify(monkeypatch):
+    """Replace theme identification with a fake that blocks until released."""
+    state = {"calls": [], "release": None}
+
+    async def fake_identify_themes_async(chunks, doc_ids, query=None):
+        state["calls"].append(query)
+        await state["release"].wait()
+        return {"query": query}
+
+    monkeypatch.setattr(pool_module, "identify_themes_async", fake_identify_themes_async)
+    return state
+
+
+def test_submit_runs_inline_when_not_started(fake_identify):
+    async def run():
+        fake_identify["release"] = asyncio.Event()
+        fake_identify["release"].set()
+        return await ThemeWorkerPool().submit(["a"], ["D1"], "q")
+
+    assert asyncio.run(run()) == {"query": "q"}
+
+
+def test_workers_resolve_submitted_requests(fake_identify):
+    async def run():
+        fake_identify["release"] = asyncio.Event()
+        pool = ThemeWorkerPool(workers=2, queue_size=4)
+        pool.start()
+        tasks = [asyncio.create_task(pool.submit(["a"], ["D1"], str(i))) for i in range(6)]
+        await asyncio.sleep(0.01)
+        fake_identify["release"].set()
+        results = await asyncio.gather(*tasks)
+        await pool.stop()
+        return results
+
+    assert asyncio.run(run()) == [{"query": str(i)} for i in range(6)]
+
+
+def test_stop_fails_running_and_queued_requests(fake_identify):
+    async def run():
+        fake_identify["release"] = asyncio.Event()
+        pool = ThemeWorkerPool(workers=1, queue_size=4)
+        pool.start()
+        running = asyncio.create_task(pool.submit(["a"], ["D1"], "running"))
+        queued = asyncio.create_task(pool.submit(["b"], ["D2"], "queued"))
+        await asyncio.sleep(0.01)
+        await pool.stop()
+        return await asyncio.gather(running, queued, return_exceptions=True)
+
+    running, queued = asyncio.run(run())
+    assert isinstance(running, asyncio.CancelledError)
+    assert isinstance(queued, RuntimeError)
+    assert fake_identify["calls"] == ["running"]